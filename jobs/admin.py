@@ -0,0 +1,31 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "task",
+        "status",
+        "attempts",
+        "duration_ms",
+        "claimed_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "task")
+    readonly_fields = (
+        "task",
+        "payload",
+        "attempts",
+        "claimed_by",
+        "started_at",
+        "heartbeat_at",
+        "finished_at",
+        "duration_ms",
+        "last_error",
+        "created_at",
+    )
+    ordering = ("-id",)
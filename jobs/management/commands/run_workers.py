@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent import futures
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.models import Job
+from jobs.runner import init_worker, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Claim queued jobs and run them in a pool of worker processes, "
+        "recording the duration and attempts of every job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes. 0 runs the jobs in this process.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for new jobs when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        if processes < 0:
+            raise CommandError("--processes must not be negative.")
+
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.executor = None
+        if processes:
+            # Worker processes open their own connections; spawned processes
+            # do not inherit the ones of this process
+            connections.close_all()
+            self.executor = futures.ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            )
+
+        try:
+            self.run(max(processes, 1), options["poll_interval"], options["once"])
+        except KeyboardInterrupt:
+            # Claimed jobs that did not start are picked up again after
+            # JOB_TIMEOUT
+            self.stdout.write("Stopping workers.")
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, slots, poll_interval, once):
+        in_flight = {}
+        while True:
+            # Keep every worker busy
+            free = slots - len(in_flight)
+            if free:
+                for job_id in Job.objects.claim(self.worker, free):
+                    in_flight[self.submit(job_id)] = job_id
+
+            if not in_flight:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = futures.wait(
+                in_flight, timeout=poll_interval, return_when=futures.FIRST_COMPLETED
+            )
+            for future in done:
+                self.report(in_flight.pop(future), future)
+
+    def submit(self, job_id):
+        if self.executor is not None:
+            return self.executor.submit(run_job, job_id, self.worker)
+        future = futures.Future()
+        try:
+            future.set_result(run_job(job_id, self.worker))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def report(self, job_id, future):
+        try:
+            status, task, attempt, duration_ms = future.result()
+        except Exception as error:
+            # The job is left running and retried after JOB_TIMEOUT
+            self.stderr.write(f"Job {job_id} could not be run: {error!r}")
+            return
+        message = (
+            f"Job {job_id} {task} {status} in {duration_ms:.1f}ms (attempt {attempt})"
+        )
+        if status == Job.Status.DONE:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stderr.write(message)
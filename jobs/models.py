@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class JobQuerySet(models.QuerySet):
+    def timed_out(self, now):
+        # Running jobs whose worker has not sent a heartbeat within JOB_TIMEOUT
+        stale = now - timedelta(seconds=settings.JOB_TIMEOUT)
+        return self.filter(status=Job.Status.RUNNING, heartbeat_at__lt=stale)
+
+    def claimable(self, now):
+        # Pending jobs that are due, and timed out jobs with attempts left
+        stale = now - timedelta(seconds=settings.JOB_TIMEOUT)
+        return self.filter(
+            Q(status=Job.Status.PENDING, run_after__lte=now)
+            | Q(
+                status=Job.Status.RUNNING,
+                heartbeat_at__lt=stale,
+                attempts__lt=F("max_attempts"),
+            )
+        )
+
+
+class JobManager(models.Manager.from_queryset(JobQuerySet)):
+    def enqueue(self, task, **payload):
+        """
+        Queue ``task``, the dotted path of a function, to be called with
+        ``payload`` as keyword arguments by a worker.
+        """
+        return self.create(
+            task=task, payload=payload, max_attempts=settings.JOB_MAX_ATTEMPTS
+        )
+
+    def claim(self, worker, limit):
+        """
+        Claim up to ``limit`` due jobs for ``worker`` and return their ids.
+
+        Each job is claimed with a conditional UPDATE that only matches while
+        the job is still claimable, so a job is never claimed by two workers
+        and no lock is held between reading and claiming.
+        """
+        now = timezone.now()
+        # Timed out jobs out of attempts are given up like failed ones
+        self.timed_out(now).filter(attempts__gte=F("max_attempts")).update(
+            status=Job.Status.FAILED,
+            finished_at=now,
+            last_error=f"Timed out after {settings.JOB_TIMEOUT}s",
+        )
+        candidates = (
+            self.claimable(now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[: limit * 2]
+        )
+        claimed = []
+        for job_id in candidates:
+            if (
+                self.claimable(now)
+                .filter(id=job_id)
+                .update(
+                    status=Job.Status.RUNNING,
+                    claimed_by=worker,
+                    started_at=now,
+                    heartbeat_at=now,
+                    finished_at=None,
+                    attempts=F("attempts") + 1,
+                )
+            ):
+                claimed.append(job_id)
+                if len(claimed) == limit:
+                    break
+        return claimed
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        RUNNING = "running", _("Running")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    task = models.CharField(verbose_name=_("Task"), max_length=200)
+    payload = models.JSONField(verbose_name=_("Payload"), default=dict)
+    status = models.CharField(
+        verbose_name=_("Status"),
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(verbose_name=_("Attempts"), default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name=_("Max attempts"), default=3
+    )
+    run_after = models.DateTimeField(verbose_name=_("Run after"), default=timezone.now)
+    claimed_by = models.CharField(
+        verbose_name=_("Claimed by"), max_length=100, blank=True
+    )
+    started_at = models.DateTimeField(
+        verbose_name=_("Started at"), blank=True, null=True
+    )
+    heartbeat_at = models.DateTimeField(
+        verbose_name=_("Heartbeat at"), blank=True, null=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_("Finished at"), blank=True, null=True
+    )
+    duration_ms = models.FloatField(
+        verbose_name=_("Duration (ms)"), blank=True, null=True
+    )
+    last_error = models.TextField(verbose_name=_("Last error"), blank=True)
+    created_at = models.DateTimeField(verbose_name=_("Created at"), auto_now_add=True)
+
+    objects = JobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "run_after"], name="job_status_run_after_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
@@ -0,0 +1,91 @@
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+import django
+
+
+def init_worker():
+    """
+    Set up Django in a freshly started worker process.
+    """
+    django.setup()
+
+
+def send_heartbeats(job_id, attempt, stop):
+    """
+    Refresh the heartbeat of attempt ``attempt`` of a running job every
+    JOB_HEARTBEAT_INTERVAL seconds until ``stop`` is set, so that a job
+    running longer than JOB_TIMEOUT is not claimed again.
+    """
+    from django.conf import settings
+    from django.db import connection
+    from django.utils import timezone
+
+    from .models import Job
+
+    try:
+        while not stop.wait(settings.JOB_HEARTBEAT_INTERVAL):
+            Job.objects.filter(
+                id=job_id, status=Job.Status.RUNNING, attempts=attempt
+            ).update(heartbeat_at=timezone.now())
+    finally:
+        # Each thread has a connection of its own
+        connection.close()
+
+
+def run_job(job_id, worker):
+    """
+    Run a job claimed by ``worker`` and record its duration and outcome.
+    Failed jobs are retried with an exponential backoff until they reach
+    their maximum number of attempts. Returns the job's new status.
+    """
+    # Imported here: worker processes load this module before Django is set up
+    from django.conf import settings
+    from django.utils import timezone
+    from django.utils.module_loading import import_string
+
+    from .models import Job
+
+    job = Job.objects.get(id=job_id)
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=send_heartbeats, args=(job_id, job.attempts, stop), daemon=True
+    )
+    heartbeat.start()
+    started = time.perf_counter()
+    try:
+        import_string(job.task)(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    finally:
+        stop.set()
+        heartbeat.join()
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    now = timezone.now()
+    outcome = {"finished_at": now, "duration_ms": duration_ms}
+    if error is None:
+        outcome.update(status=Job.Status.DONE, last_error="")
+    elif job.attempts < job.max_attempts:
+        delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        outcome.update(
+            status=Job.Status.PENDING,
+            run_after=now + timedelta(seconds=delay),
+            last_error=error,
+        )
+    else:
+        outcome.update(status=Job.Status.FAILED, last_error=error)
+
+    # A job claimed again after a timeout is left to its newer attempt, even
+    # when that attempt runs under the same worker
+    Job.objects.filter(
+        id=job_id,
+        status=Job.Status.RUNNING,
+        claimed_by=worker,
+        attempts=job.attempts,
+    ).update(**outcome)
+    return outcome["status"], job.task, job.attempts, duration_ms
@@ -0,0 +1,128 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .runner import run_job
+
+calls = []
+
+
+def record_call(**kwargs):
+    calls.append(kwargs)
+
+
+def fail(**kwargs):
+    raise RuntimeError("Boom")
+
+
+def sleep_then_claim(seconds):
+    # Another worker looks for jobs to take over once JOB_TIMEOUT has passed
+    time.sleep(seconds)
+    calls.append(Job.objects.claim("worker-2", 1))
+
+
+def claim_again(job_id):
+    # Another run of the same worker claims the job after a timeout
+    Job.objects.filter(id=job_id).update(attempts=F("attempts") + 1)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def run_workers(self):
+        out = io.StringIO()
+        call_command(
+            "run_workers", "--processes", "0", "--once", stdout=out, stderr=out
+        )
+        return out.getvalue()
+
+    def test_claim_is_exclusive(self):
+        job = Job.objects.enqueue("jobs.tests.record_call", value=1)
+
+        self.assertEqual(Job.objects.claim("worker-1", 5), [job.id])
+        self.assertEqual(Job.objects.claim("worker-2", 5), [])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.RUNNING)
+        self.assertEqual((job.claimed_by, job.attempts), ("worker-1", 1))
+
+        # A job whose worker stopped reporting is claimed again
+        with override_settings(JOB_TIMEOUT=0):
+            self.assertEqual(Job.objects.claim("worker-2", 5), [job.id])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_TIMEOUT=0)
+    def test_timed_out_job_is_failed_after_max_attempts(self):
+        job = Job.objects.enqueue("jobs.tests.record_call", value=1)
+
+        self.assertEqual(Job.objects.claim("worker-1", 5), [job.id])
+        self.assertEqual(Job.objects.claim("worker-2", 5), [job.id])
+        self.assertEqual(Job.objects.claim("worker-3", 5), [])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        self.assertEqual(job.last_error, "Timed out after 0s")
+
+    def test_run_workers(self):
+        job = Job.objects.enqueue("jobs.tests.record_call", value=1)
+
+        output = self.run_workers()
+
+        self.assertEqual(calls, [{"value": 1}])
+        self.assertIn(f"Job {job.id} jobs.tests.record_call done", output)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertIsNotNone(job.duration_ms)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=60)
+    def test_failed_job_is_retried(self):
+        job = Job.objects.enqueue("jobs.tests.fail")
+
+        self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.PENDING, 1))
+        self.assertIn("RuntimeError: Boom", job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+
+        # The retry is not due yet
+        self.run_workers()
+        self.assertEqual(Job.objects.get().attempts, 1)
+
+        Job.objects.update(run_after=timezone.now())
+        self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+
+    def test_stale_attempt_does_not_overwrite_newer_one(self):
+        job = Job.objects.enqueue("jobs.tests.claim_again")
+        job.payload = {"job_id": job.id}
+        job.save()
+        Job.objects.claim("worker-1", 1)
+
+        status, _, attempt, _ = run_job(job.id, "worker-1")
+
+        self.assertEqual((status, attempt), (Job.Status.DONE, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.RUNNING, 2))
+
+
+class JobHeartbeatTest(TransactionTestCase):
+    @override_settings(JOB_HEARTBEAT_INTERVAL=0.05, JOB_TIMEOUT=0.2)
+    def test_running_job_sends_heartbeats(self):
+        calls.clear()
+        job = Job.objects.enqueue("jobs.tests.sleep_then_claim", seconds=0.5)
+        Job.objects.claim("worker-1", 1)
+
+        run_job(job.id, "worker-1")
+
+        # The job outlived JOB_TIMEOUT without being claimed again
+        self.assertEqual(calls, [[]])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.DONE, 1))
+        self.assertGreater(job.heartbeat_at, job.started_at + timedelta(seconds=0.3))
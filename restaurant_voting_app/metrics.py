@@ -0,0 +1,92 @@
+"""
+Prometheus metrics of the app.
+
+Metrics are collected in-process. To aggregate them over several worker
+processes, point the PROMETHEUS_MULTIPROC_DIR environment variable at a
+shared, empty directory before the workers start.
+
+The metrics endpoint only answers staff users, clients sending the bearer
+token in settings.METRICS_TOKEN and clients from
+settings.METRICS_ALLOWED_NETWORKS. Behind a reverse proxy every request
+comes from the proxy's address, so leave the networks empty there and give
+the token to the Prometheus server instead.
+"""
+
+import hmac
+import ipaddress
+import os
+
+import prometheus_client
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import Counter, Histogram, multiprocess
+
+from user_profiles.authentication import authenticate
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by URL name.",
+    ["view", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by URL name and status code.",
+    ["view", "method", "status"],
+)
+VOTES_RECORDED = Counter(
+    "votes_recorded_total",
+    "Menu votes recorded by URL name.",
+    ["view"],
+)
+DUPLICATE_VOTES = Counter(
+    "duplicate_votes_rejected_total",
+    "Votes rejected because the employee had already voted, by URL name.",
+    ["view"],
+)
+LEADERBOARD_CACHE = Counter(
+    "leaderboard_cache_lookups_total",
+    "Leaderboard cache lookups by result.",
+    ["result"],
+)
+
+
+def is_metrics_client(request):
+    """
+    Return whether ``request`` may read the metrics: it carries the bearer
+    token of settings.METRICS_TOKEN, comes from one of
+    settings.METRICS_ALLOWED_NETWORKS or is authenticated as a staff user.
+    """
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if (
+        settings.METRICS_TOKEN
+        and scheme.lower() == "bearer"
+        and hmac.compare_digest(credentials.strip(), settings.METRICS_TOKEN)
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        address = None
+    if address is not None and any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    ):
+        return True
+    user = authenticate(request)
+    return user is not None and user.is_staff
+
+
+def metrics_view(request):
+    # Expose all metrics in the Prometheus text format
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return HttpResponse(
+        prometheus_client.generate_latest(registry),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
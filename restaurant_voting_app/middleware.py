@@ -0,0 +1,135 @@
+import logging
+import time
+
+from asgiref import sync
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """
+    Execute wrapper that counts the queries of a request and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    """
+    Report the number of queries and the database time of every request in
+    the X-DB-Query-Count and X-DB-Time-Ms headers, and check them against
+    the budget configured for the URL name in settings.QUERY_BUDGETS.
+
+    A request over budget is logged, or raises QueryBudgetExceeded when
+    settings.QUERY_BUDGET_STRICT is set, which is the case in tests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if sync.iscoroutinefunction(self.get_response):
+            sync.markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if sync.iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        return self.process_counts(request, response, counter)
+
+    async def __acall__(self, request):
+        # Async ORM calls run on the request's thread sensitive thread, which
+        # has its own connection, so the wrapper is installed there
+        counter = QueryCounter()
+        await sync.sync_to_async(lambda: connection.execute_wrappers.append(counter))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync.sync_to_async(
+                lambda: connection.execute_wrappers.remove(counter)
+            )()
+        return self.process_counts(request, response, counter)
+
+    def process_counts(self, request, response, counter):
+        response["X-DB-Query-Count"] = str(counter.count)
+        response["X-DB-Time-Ms"] = f"{counter.duration * 1000:.2f}"
+
+        resolver_match = getattr(request, "resolver_match", None)
+        url_name = resolver_match.url_name if resolver_match else None
+        budget = settings.QUERY_BUDGETS.get(url_name)
+        if budget is None:
+            return response
+
+        overruns = []
+        if "queries" in budget and counter.count > budget["queries"]:
+            overruns.append(f"{counter.count} queries (budget {budget['queries']})")
+        db_time_ms = counter.duration * 1000
+        if "db_time_ms" in budget and db_time_ms > budget["db_time_ms"]:
+            overruns.append(
+                f"{db_time_ms:.2f}ms of database time "
+                f"(budget {budget['db_time_ms']}ms)"
+            )
+
+        if overruns:
+            message = f"{url_name} exceeded its budget: {', '.join(overruns)}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record the latency and status code of every request in the Prometheus
+    metrics, labelled by URL name.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if sync.iscoroutinefunction(self.get_response):
+            sync.markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if sync.iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, duration):
+        # Unresolved paths share one label to keep the cardinality bounded
+        resolver_match = getattr(request, "resolver_match", None)
+        view = resolver_match.url_name if resolver_match else "unmatched"
+        metrics.REQUEST_LATENCY.labels(view, request.method).observe(duration)
+        metrics.REQUESTS.labels(view, request.method, response.status_code).inc()
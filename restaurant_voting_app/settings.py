@@ -22,6 +22,7 @@ SENDGRID_SENDER_EMAIL = os.environ.get("SENDGRID_SENDER_EMAIL")
 INSTALLED_APPS = [
     "votes",
     "restaurants",
+    "jobs",
     "user_profiles",
     "address",
     "phonenumber_field",
@@ -37,6 +38,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "restaurant_voting_app.middleware.MetricsMiddleware",
+    "restaurant_voting_app.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -107,12 +110,19 @@ MEDIA_URL = "/images/"
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "static/images")
 
+# How menu downloads are sent: None streams them from Python, "x-sendfile"
+# hands the file path to Apache/lighttpd and "x-accel-redirect" hands the
+# internal location below to nginx
+MENU_FILE_SENDFILE = None
+MENU_FILE_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+MENU_FILE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "user_profiles.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -126,6 +136,104 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = "user_profiles.UserProfile"
 
+# Credentials issued on login and registration unless the client asks for
+# one kind with ?auth=: "jwt" for a JWT pair, "token" for an API token or
+# "both"
+LOGIN_AUTH_MODE = "both"
+
+# Per URL name limits on the queries ("queries") and database time
+# ("db_time_ms") of a request. Overruns are logged, and fail the request
+# when QUERY_BUDGET_STRICT is set.
+QUERY_BUDGETS = {
+    "vote-menu": {"queries": 13},
+    "vote-menu-async": {"queries": 13},
+    "winning-menu": {"queries": 2},
+    "winning-menu-async": {"queries": 2},
+    "vote-standings": {"queries": 3},
+    "daily-winners": {"queries": 3},
+    "get-current-day-menu": {"queries": 2},
+    "restaurant-list": {"queries": 2},
+    "restaurant-search": {"queries": 2},
+    "menu-file": {"queries": 2},
+}
+QUERY_BUDGET_STRICT = False
+
+# Bearer token the Prometheus server sends to read /metrics without
+# authenticating as a staff user
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Networks allowed to read /metrics without credentials. Empty by default:
+# behind a reverse proxy every request comes from the proxy's address, so
+# only list networks here when clients reach the app directly
+METRICS_ALLOWED_NETWORKS = []
+
+# Runs the tests with QUERY_BUDGET_STRICT set
+TEST_RUNNER = "restaurant_voting_app.test_runner.TestRunner"
+
+# Number of counter rows each menu's votes are spread over
+MENU_VOTE_SHARDS = 8
+
+# Number of rows each menu's tally for a day is spread over
+DAILY_TALLY_SHARDS = 8
+
+# The leaderboard versions, vote throttles and token cache must be shared by
+# every worker process, so deployments set REDIS_URL. Without it each
+# process has a cache of its own, which is only right for a single process
+# such as runserver or the tests; "check --deploy" reports it.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Send ETags built from the leaderboard versions in the cache. They are only
+# valid when every process shares the versions, so they follow REDIS_URL.
+DAY_ETAGS = bool(REDIS_URL)
+
+# Cached results for the current day; bump the version when the cached
+# payload changes shape
+LEADERBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+LEADERBOARD_CACHE_VERSION = 1
+
+# Token bucket limits of the vote endpoints per Build-Version header, as
+# "<requests>/<s|min|hour|day>"; "default" covers other versions and None
+# disables the throttle
+VOTE_THROTTLE_RATES = {
+    "old": "10/min",
+    "new": "10/min",
+    "default": "10/min",
+}
+
+# Background jobs: seconds before a running job whose worker has not sent a
+# heartbeat is run again, seconds between the heartbeats of a running job,
+# attempts per job and the base retry delay in seconds, doubled on every
+# attempt
+JOB_TIMEOUT = 60 * 10
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+
+# Seconds the response to a vote sent with an Idempotency-Key is replayed
+VOTE_IDEMPOTENCY_TTL = 60 * 60 * 24
+
+# Seconds a token's user is cached in the shared cache and in the LRU of
+# each process, and the number of tokens each LRU holds. Logging out takes
+# up to TOKEN_AUTH_LOCAL_CACHE_TTL to reach the other processes. Users
+# changed with QuerySet.update() keep their cached state for up to
+# TOKEN_AUTH_CACHE_TTL unless user_profiles.signals.evict_user() is called.
+TOKEN_AUTH_CACHE_TTL = 60 * 5
+TOKEN_AUTH_LOCAL_CACHE_TTL = 10
+TOKEN_AUTH_LOCAL_CACHE_SIZE = 1024
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
 ]
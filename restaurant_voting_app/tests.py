@@ -0,0 +1,150 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from restaurants.models import Menu, Restaurant
+from user_profiles.models import Employee, Organization, Role, UserProfile
+
+from .middleware import QueryBudgetExceeded
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        Menu.objects.create(restaurant=Restaurant.objects.create(name="Restaurant 1"))
+
+    def test_query_headers(self):
+        response = self.client.get(reverse("restaurant:get-current-day-menu"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-DB-Query-Count"], "2")
+        self.assertGreater(float(response["X-DB-Time-Ms"]), 0)
+
+    async def test_query_headers_async_view(self):
+        response = await self.async_client.get(
+            reverse("winning-menu-async"),
+            headers={"Authorization": f"Token {self.token.key}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-DB-Query-Count"], "2")
+
+    @override_settings(QUERY_BUDGETS={"get-current-day-menu": {"queries": 1}})
+    def test_over_budget_fails_in_tests(self):
+        with self.assertRaisesMessage(
+            QueryBudgetExceeded, "get-current-day-menu exceeded its budget"
+        ):
+            self.client.get(reverse("restaurant:get-current-day-menu"))
+
+    @override_settings(
+        QUERY_BUDGETS={"get-current-day-menu": {"queries": 1}},
+        QUERY_BUDGET_STRICT=False,
+    )
+    def test_over_budget_logged(self):
+        with self.assertLogs("restaurant_voting_app.middleware", "WARNING"):
+            response = self.client.get(reverse("restaurant:get-current-day-menu"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name="Restaurant 1")
+        )
+        self.employee = Employee.objects.create(
+            user=self.user,
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_vote_metrics(self):
+        recorded = self.sample("votes_recorded_total", view="vote-menu")
+        duplicates = self.sample("duplicate_votes_rejected_total", view="vote-menu")
+        requests = self.sample(
+            "http_requests_total", view="vote-menu", method="POST", status="200"
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(2):
+                self.client.post(
+                    reverse("vote-menu"),
+                    {"menu_id": self.menu.id, "employee_id": self.employee.id},
+                    format="json",
+                    HTTP_BUILD_VERSION="old",
+                )
+
+        # Votes are counted once they are committed
+        self.assertEqual(
+            self.sample("votes_recorded_total", view="vote-menu"), recorded
+        )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            self.sample("votes_recorded_total", view="vote-menu"), recorded + 1
+        )
+        self.assertEqual(
+            self.sample("duplicate_votes_rejected_total", view="vote-menu"),
+            duplicates + 1,
+        )
+        self.assertEqual(
+            self.sample(
+                "http_requests_total", view="vote-menu", method="POST", status="200"
+            ),
+            requests + 1,
+        )
+
+    @override_settings(METRICS_TOKEN="metrics-token")
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("winning-menu"))
+
+        # Prometheus sends only the bearer token
+        response = Client().get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer metrics-token"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            b'http_request_duration_seconds_bucket{le="0.005",method="GET",'
+            b'view="winning-menu"}',
+            response.content,
+        )
+        self.assertIn(b"leaderboard_cache_lookups_total", response.content)
+
+    def test_metrics_endpoint_restricted(self):
+        url = reverse("metrics")
+
+        # Requests relayed by a local reverse proxy come from localhost
+        response = self.client.get(url, REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS_TOKEN="metrics-token"):
+            response = Client().get(url, HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS_ALLOWED_NETWORKS=["203.0.113.0/24"]):
+            response = self.client.get(url, REMOTE_ADDR="203.0.113.7")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
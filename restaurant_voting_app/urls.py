@@ -3,6 +3,7 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from restaurant_voting_app.metrics import metrics_view
 from restaurants import urls as restaurant_urls
 from user_profiles import urls as user_profile_urls
 from votes import urls as vote_urls
@@ -12,6 +13,7 @@ urlpatterns = [
     path("user_profiles/", include(user_profile_urls)),
     path("restaurants/", include(restaurant_urls)),
     path("votes/", include(vote_urls)),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
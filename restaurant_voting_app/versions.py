@@ -0,0 +1,71 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(day):
+    return f"leaderboard:{day.isoformat()}:version"
+
+
+def increment(key, initial=0, timeout=None):
+    """
+    Increment the counter at ``key`` in the leaderboard cache, seeding it
+    with ``initial`` when it is missing.
+    """
+    # incr() fails on a missing key, so seed it first; add() is a no-op when
+    # the key already exists
+    cache.add(key, initial, timeout=timeout, version=settings.LEADERBOARD_CACHE_VERSION)
+    return cache.incr(key, version=settings.LEADERBOARD_CACHE_VERSION)
+
+
+def leaderboard_version(day):
+    """
+    Return the current version of the leaderboard for ``day``. Versions
+    expire with the entries they validate; a lost version is re-seeded from
+    the clock so it never matches an older cached entry.
+    """
+    key = _version_key(day)
+    version = cache.get(key, version=settings.LEADERBOARD_CACHE_VERSION)
+    if version is None:
+        cache.add(
+            key,
+            int(time.time() * 1000),
+            timeout=settings.LEADERBOARD_CACHE_TIMEOUT,
+            version=settings.LEADERBOARD_CACHE_VERSION,
+        )
+        version = cache.get(key, version=settings.LEADERBOARD_CACHE_VERSION)
+    return version
+
+
+def invalidate_leaderboard(day):
+    """
+    Move the leaderboard for ``day`` to a new version once the current
+    transaction commits, so readers never cache data that is about to change.
+    """
+    transaction.on_commit(
+        lambda: increment(
+            _version_key(day),
+            initial=int(time.time() * 1000),
+            timeout=settings.LEADERBOARD_CACHE_TIMEOUT,
+        )
+    )
+
+
+def day_etag(resource, day):
+    """
+    Return the ETag of ``resource`` for ``day`` from the day's leaderboard
+    version, or None when settings.DAY_ETAGS is off. The version moves
+    whenever a menu of the day or its votes change, so it validates both the
+    day's menus and its results without a query.
+    """
+    # A version kept in a cache of one process never sees the votes made
+    # through the others, so its ETags would validate stale responses
+    if not settings.DAY_ETAGS:
+        return None
+    return f'"{resource}:{day.isoformat()}:{leaderboard_version(day)}"'
+
+
+aday_etag = sync_to_async(day_etag)
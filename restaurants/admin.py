@@ -15,7 +15,7 @@ class RestaurantAdmin(admin.ModelAdmin):
 
 
 class MenuAdmin(admin.ModelAdmin):
-    list_display = ("id", "restaurant", "file", "votes", "created_at")
+    list_display = ("id", "restaurant", "file", "votes", "menu_date", "created_at")
 
 
 admin.site.register(Restaurant, RestaurantAdmin)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RestaurantsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "restaurants"
+
+    def ready(self):
+        from .search import reinstall_search_triggers
+
+        post_migrate.connect(reinstall_search_triggers, sender=self)
@@ -0,0 +1,56 @@
+import re
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Return the inclusive ``(start, end)`` byte positions asked for by a
+    single-range ``Range`` header, or None to send the whole file. Multiple
+    ranges and malformed headers are answered with the whole file, which
+    RFC 9110 allows. Raises RangeNotSatisfiable for ranges past the end.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+
+    if not first:
+        # A suffix range: the last N bytes
+        if not last:
+            return None
+        length = int(last)
+        # An empty file has no last bytes to send
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(file, start, end, chunk_size=64 * 1024):
+    """
+    Yield the bytes from ``start`` to ``end`` inclusive of an open file in
+    chunks, closing it when done.
+    """
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from restaurants.models import Menu, MenuVoteShard
+
+
+class Command(BaseCommand):
+    help = "Fold the sharded vote counters back into Menu.votes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of shard rows folded per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        folded_shards = 0
+        folded_votes = 0
+        last_id = 0
+
+        while True:
+            with transaction.atomic():
+                shards = list(
+                    MenuVoteShard.objects.filter(id__gt=last_id)
+                    .exclude(count=0)
+                    .order_by("id")
+                    .values_list("id", "menu_id", "count")[:batch_size]
+                )
+                if not shards:
+                    break
+                last_id = shards[-1][0]
+
+                votes_by_menu = {}
+                for _, menu_id, count in shards:
+                    votes_by_menu[menu_id] = votes_by_menu.get(menu_id, 0) + count
+
+                # Add the folded counts to the menus
+                Menu.objects.filter(id__in=votes_by_menu).update(
+                    votes=F("votes")
+                    + Case(
+                        *[
+                            When(id=menu_id, then=Value(votes))
+                            for menu_id, votes in votes_by_menu.items()
+                        ],
+                        default=Value(0),
+                    )
+                )
+
+                # Subtract exactly what was folded so that increments made
+                # since the shards were read are kept
+                MenuVoteShard.objects.filter(
+                    id__in=[shard_id for shard_id, _, _ in shards]
+                ).update(
+                    count=F("count")
+                    - Case(
+                        *[
+                            When(id=shard_id, then=Value(count))
+                            for shard_id, _, count in shards
+                        ],
+                        default=Value(0),
+                    )
+                )
+
+            folded_shards += len(shards)
+            folded_votes += sum(count for _, _, count in shards)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Folded {folded_votes} votes from {folded_shards} shards."
+            )
+        )
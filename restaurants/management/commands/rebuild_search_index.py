@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from jobs.models import Job
+from restaurants import search
+from restaurants.models import Menu
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search index of restaurants and menus, "
+        "reinstalling its triggers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--extract",
+            action="store_true",
+            help="Also queue text extraction for menu files without text.",
+        )
+
+    def handle(self, *args, **options):
+        if not search.search_supported():
+            raise CommandError("Full-text search needs an SQLite database.")
+
+        with transaction.atomic():
+            search.rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
+
+        if options["extract"]:
+            menu_ids = (
+                Menu.objects.filter(file_text="")
+                .exclude(file="")
+                .values_list("id", flat=True)
+            )
+            queued = 0
+            for menu_id in menu_ids.iterator():
+                Job.objects.enqueue(
+                    "restaurants.tasks.process_menu_upload", menu_id=menu_id
+                )
+                queued += 1
+            self.stdout.write(f"Queued text extraction for {queued} menus.")
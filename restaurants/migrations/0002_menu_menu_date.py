@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:22
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_menu_date(apps, schema_editor):
+    # Existing menus are dated by the day they were uploaded
+    Menu = apps.get_model("restaurants", "Menu")
+    Menu.objects.update(menu_date=TruncDate("created_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menu",
+            name="menu_date",
+            field=models.DateField(
+                db_index=True, default=datetime.date.today, verbose_name="Menu date"
+            ),
+        ),
+        migrations.RunPython(backfill_menu_date, migrations.RunPython.noop),
+    ]
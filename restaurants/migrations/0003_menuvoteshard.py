@@ -0,0 +1,60 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_menu_vote_shards(apps, schema_editor):
+    # Votes only update existing shards, so every menu gets its shards now
+    Menu = apps.get_model("restaurants", "Menu")
+    MenuVoteShard = apps.get_model("restaurants", "MenuVoteShard")
+    MenuVoteShard.objects.bulk_create(
+        [
+            MenuVoteShard(menu_id=menu_id, shard=shard)
+            for menu_id in Menu.objects.values_list("id", flat=True)
+            for shard in range(settings.MENU_VOTE_SHARDS)
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0002_menu_menu_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MenuVoteShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "menu",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="vote_shards",
+                        to="restaurants.menu",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="menuvoteshard",
+            constraint=models.UniqueConstraint(
+                fields=("menu", "shard"), name="unique_menu_vote_shard"
+            ),
+        ),
+        migrations.RunPython(create_menu_vote_shards, migrations.RunPython.noop),
+    ]
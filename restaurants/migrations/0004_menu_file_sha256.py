@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:43
+
+import hashlib
+
+from django.db import migrations, models
+
+import restaurants.storage
+
+
+def backfill_file_digests(apps, schema_editor):
+    # Files stored before this migration keep their names; only their digest
+    # and size are recorded
+    Menu = apps.get_model("restaurants", "Menu")
+    for menu in Menu.objects.exclude(file="").iterator():
+        if not menu.file.storage.exists(menu.file.name):
+            continue
+        sha256 = hashlib.sha256()
+        with menu.file.open("rb") as source:
+            for chunk in source.chunks():
+                sha256.update(chunk)
+        menu.file_sha256 = sha256.hexdigest()
+        menu.file_size = menu.file.size
+        menu.save(update_fields=["file_sha256", "file_size"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0003_menuvoteshard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menu",
+            name="file_sha256",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=64, verbose_name="File SHA-256"
+            ),
+        ),
+        migrations.AddField(
+            model_name="menu",
+            name="file_size",
+            field=models.PositiveBigIntegerField(
+                blank=True, null=True, verbose_name="File size"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="menu",
+            name="file",
+            field=models.FileField(
+                storage=restaurants.storage.menu_storage, upload_to="menus/"
+            ),
+        ),
+        migrations.RunPython(backfill_file_digests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0004_menu_file_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menu",
+            name="file_content_type",
+            field=models.CharField(
+                blank=True, max_length=100, verbose_name="File content type"
+            ),
+        ),
+        migrations.AddField(
+            model_name="menu",
+            name="page_count",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Page count"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+from restaurants import search
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is specific to SQLite; other databases search with icontains
+    if search.search_supported(schema_editor.connection):
+        search.rebuild_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    if search.search_supported(schema_editor.connection):
+        search.drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0005_menu_file_content_type_menu_page_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menu",
+            name="file_text",
+            field=models.TextField(blank=True, verbose_name="File text"),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,17 @@
+import random
+from datetime import date
+
 from address.models import AddressField
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .storage import menu_storage
+
 
 class Restaurant(models.Model):
     name = models.CharField(
@@ -27,17 +36,158 @@ class Restaurant(models.Model):
         return self.name
 
 
+def _points_case(field, points_by_id):
+    # The points of each row by ``field`` as a CASE expression
+    return Case(
+        *[
+            When(**{field: row_id}, then=Value(points))
+            for row_id, points in points_by_id.items()
+        ],
+        default=Value(0),
+    )
+
+
+class MenuQuerySet(models.QuerySet):
+    def with_vote_totals(self):
+        # Annotate each menu with its compacted votes plus the pending shards
+        return self.annotate(
+            vote_total=F("votes") + Coalesce(Sum("vote_shards__count"), 0)
+        )
+
+
 class Menu(models.Model):
     restaurant = models.ForeignKey(
         Restaurant, null=False, blank=False, on_delete=models.CASCADE
     )
 
-    file = models.FileField(upload_to="menus/")
+    file = models.FileField(upload_to="menus/", storage=menu_storage)
+
+    # Digest and size of the file content, set when the file is stored
+    file_sha256 = models.CharField(
+        verbose_name=_("File SHA-256"), max_length=64, blank=True, db_index=True
+    )
+    file_size = models.PositiveBigIntegerField(
+        verbose_name=_("File size"), blank=True, null=True
+    )
+
+    # Set by the post-upload job
+    file_content_type = models.CharField(
+        verbose_name=_("File content type"), max_length=100, blank=True
+    )
+    page_count = models.PositiveIntegerField(
+        verbose_name=_("Page count"), blank=True, null=True
+    )
+    file_text = models.TextField(verbose_name=_("File text"), blank=True)
 
     votes = models.IntegerField(default=0)
 
+    # Business date the menu is served on, stored so "today" lookups can use
+    # an index instead of truncating created_at
+    menu_date = models.DateField(
+        verbose_name=_("Menu date"), default=date.today, db_index=True
+    )
+
     created_at = models.DateTimeField(verbose_name=_("Created at"), auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name=_("Updated at"), auto_now=True)
 
+    objects = MenuQuerySet.as_manager()
+
     def __str__(self):
         return f"Menu-{self.id}"
+
+    def save(self, *args, **kwargs):
+        # Store a new file first, so that its digest and size are saved with
+        # the row
+        if self.file and not self.file._committed:
+            self.file.save(self.file.name, self.file.file, save=False)
+            self.file_sha256 = self.file.storage.digest(self.file.name)
+            self.file_size = self.file.size
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            MenuVoteShard.objects.create_shards([self.id])
+
+    @cached_property
+    def vote_total(self):
+        # Overridden by MenuQuerySet.with_vote_totals() to avoid this query
+        shard_votes = self.vote_shards.aggregate(total=Sum("count"))["total"]
+        return self.votes + (shard_votes or 0)
+
+
+class MenuVoteShardManager(models.Manager):
+    def create_shards(self, menu_ids):
+        """
+        Create the settings.MENU_VOTE_SHARDS counter rows of new menus, so
+        that votes only ever update existing rows.
+        """
+        self.bulk_create(
+            [
+                self.model(menu_id=menu_id, shard=shard)
+                for menu_id in menu_ids
+                for shard in range(settings.MENU_VOTE_SHARDS)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def add_votes(self, points_by_menu):
+        """
+        Add points to menus given as a ``{menu_id: points}`` mapping.
+
+        Each menu gets one randomly chosen shard incremented, so concurrent
+        voters for the same menu rarely contend for the same row. A single
+        UPDATE is run however many menus are given. Menus created without
+        their shards, such as with bulk_create(), have their points added to
+        Menu.votes instead, at the cost of two more queries.
+
+        SQLite serializes writers per database, so there the shards do not
+        reduce contention; they pay off on databases with row locks.
+        """
+        chosen_shards = {
+            menu_id: random.randrange(settings.MENU_VOTE_SHARDS)
+            for menu_id in points_by_menu
+        }
+
+        shard_filter = Q()
+        for menu_id, shard in chosen_shards.items():
+            shard_filter |= Q(menu_id=menu_id, shard=shard)
+
+        updated = self.filter(shard_filter).update(
+            count=F("count") + _points_case("menu_id", points_by_menu)
+        )
+        if updated == len(chosen_shards):
+            return
+
+        # Shards are only created along with their menu, so the menus
+        # without the chosen shard are exactly the ones not updated
+        sharded = set(self.filter(shard_filter).values_list("menu_id", flat=True))
+        unsharded = {
+            menu_id: points
+            for menu_id, points in points_by_menu.items()
+            if menu_id not in sharded
+        }
+        Menu.objects.filter(id__in=unsharded).update(
+            votes=F("votes") + _points_case("id", unsharded)
+        )
+
+
+class MenuVoteShard(models.Model):
+    """
+    Part of a menu's vote counter. A menu's total is ``Menu.votes`` plus the
+    sum of its shards; compact_vote_shards folds shards back into the menu.
+    """
+
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name="vote_shards")
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    objects = MenuVoteShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["menu", "shard"], name="unique_menu_vote_shard"
+            )
+        ]
+
+    def __str__(self):
+        return f"Menu-{self.menu_id} shard {self.shard}"
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only pagination on ``(name, id)``. The cursor holds the last row
+    of the previous page, so every page is one indexed range scan of
+    ``page_size + 1`` rows, without OFFSET or COUNT queries. Rows without a
+    name come first.
+    """
+
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            name, pk = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if not (name is None or isinstance(name, str)) or not isinstance(pk, int):
+                raise ValueError
+        except (binascii.Error, TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return name, pk
+
+    def encode_cursor(self, row):
+        payload = json.dumps([row.name, row.pk]).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            name, pk = cursor
+            if name is None:
+                queryset = queryset.filter(
+                    Q(name__isnull=True, pk__gt=pk) | Q(name__isnull=False)
+                )
+            else:
+                queryset = queryset.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+
+        # Fetch one extra row to know whether there is a next page
+        rows = list(
+            queryset.order_by(F("name").asc(nulls_first=True), "pk")[: page_size + 1]
+        )
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = self.encode_cursor(rows[-1])
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
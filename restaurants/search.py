@@ -0,0 +1,225 @@
+"""
+Full-text search over restaurant names and descriptions and the text of
+menu files, backed by an SQLite FTS5 table kept in sync by triggers.
+
+Every restaurant and every menu is one row of the index. Restaurants use
+rowid ``2 * id`` and menus ``2 * id + 1``, so the triggers update and delete
+rows by rowid. On other databases search falls back to ``icontains``.
+"""
+
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import Restaurant
+
+TABLE = "restaurants_search"
+
+CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+    kind UNINDEXED,
+    restaurant_id UNINDEXED,
+    menu_id UNINDEXED,
+    name,
+    body,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+INSERT_RESTAURANT = f"""
+INSERT INTO {TABLE} (rowid, kind, restaurant_id, menu_id, name, body)
+VALUES (NEW.id * 2, 'restaurant', NEW.id, NULL, coalesce(NEW.name, ''),
+        NEW.description);
+"""
+
+INSERT_MENU = f"""
+INSERT INTO {TABLE} (rowid, kind, restaurant_id, menu_id, name, body)
+SELECT NEW.id * 2 + 1, 'menu', restaurant.id, NEW.id,
+       coalesce(restaurant.name, ''), NEW.file_text
+FROM restaurants_restaurant AS restaurant
+WHERE restaurant.id = NEW.restaurant_id;
+"""
+
+TRIGGER_NAMES = [
+    "restaurant_insert",
+    "restaurant_update",
+    "restaurant_delete",
+    "menu_insert",
+    "menu_update",
+    "menu_delete",
+]
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_restaurant_insert
+    AFTER INSERT ON restaurants_restaurant BEGIN
+        {INSERT_RESTAURANT}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_restaurant_update
+    AFTER UPDATE OF name, description ON restaurants_restaurant BEGIN
+        DELETE FROM {TABLE} WHERE rowid = OLD.id * 2;
+        {INSERT_RESTAURANT}
+        UPDATE {TABLE} SET name = coalesce(NEW.name, '')
+        WHERE rowid IN (
+            SELECT id * 2 + 1 FROM restaurants_menu
+            WHERE restaurant_id = NEW.id
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_restaurant_delete
+    AFTER DELETE ON restaurants_restaurant BEGIN
+        DELETE FROM {TABLE} WHERE rowid = OLD.id * 2;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_menu_insert
+    AFTER INSERT ON restaurants_menu BEGIN
+        {INSERT_MENU}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_menu_update
+    AFTER UPDATE OF file_text, restaurant_id ON restaurants_menu BEGIN
+        DELETE FROM {TABLE} WHERE rowid = OLD.id * 2 + 1;
+        {INSERT_MENU}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_menu_delete
+    AFTER DELETE ON restaurants_menu BEGIN
+        DELETE FROM {TABLE} WHERE rowid = OLD.id * 2 + 1;
+    END
+    """,
+]
+
+REBUILD = [
+    f"DELETE FROM {TABLE}",
+    f"""
+    INSERT INTO {TABLE} (rowid, kind, restaurant_id, menu_id, name, body)
+    SELECT id * 2, 'restaurant', id, NULL, coalesce(name, ''), description
+    FROM restaurants_restaurant
+    """,
+    f"""
+    INSERT INTO {TABLE} (rowid, kind, restaurant_id, menu_id, name, body)
+    SELECT menu.id * 2 + 1, 'menu', restaurant.id, menu.id,
+           coalesce(restaurant.name, ''), menu.file_text
+    FROM restaurants_menu AS menu
+    JOIN restaurants_restaurant AS restaurant
+        ON restaurant.id = menu.restaurant_id
+    """,
+    f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')",
+]
+
+# bm25() weights for kind, restaurant_id, menu_id, name and body
+SEARCH = f"""
+SELECT search.kind, search.restaurant_id, search.menu_id, menu.menu_date,
+       search.name, snippet({TABLE}, 4, '[', ']', '...', 12),
+       bm25({TABLE}, 0, 0, 0, 10.0, 1.0) AS score
+FROM {TABLE} AS search
+LEFT JOIN restaurants_menu AS menu ON menu.id = search.menu_id
+WHERE {TABLE} MATCH %s
+ORDER BY score
+LIMIT %s
+"""
+
+
+def search_supported(using_connection=None):
+    return (using_connection or connection).vendor == "sqlite"
+
+
+def install_search_index(using_connection):
+    """
+    Create the index table and its triggers if they are missing. SQLite
+    drops the triggers when Django rebuilds a table during a migration, so
+    this is run again after every migrate and by rebuild_search_index.
+    """
+    with using_connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def reinstall_search_triggers(sender, using, **kwargs):
+    # post_migrate receiver; the index is created by a migration, so nothing
+    # is installed before it has run
+    using_connection = connections[using]
+    if not search_supported(using_connection):
+        return
+    if TABLE in using_connection.introspection.table_names():
+        install_search_index(using_connection)
+
+
+def drop_search_index(using_connection):
+    with using_connection.cursor() as cursor:
+        for trigger in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TABLE}_{trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def rebuild_search_index(using_connection):
+    """
+    Reinstall the triggers and fill the index from the current rows.
+    """
+    install_search_index(using_connection)
+    with using_connection.cursor() as cursor:
+        for statement in REBUILD:
+            cursor.execute(statement)
+
+
+def build_match_query(query):
+    # Quote every word, so user input can never be read as FTS5 syntax; the
+    # last word also matches as a prefix while the user is typing
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(query, limit):
+    """
+    Return up to ``limit`` restaurants and menus matching ``query``, best
+    match first.
+    """
+    match_query = build_match_query(query)
+    if match_query is None:
+        return []
+
+    if not search_supported():
+        restaurants = Restaurant.objects.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        )[:limit]
+        return [
+            {
+                "type": "restaurant",
+                "restaurant_id": restaurant.id,
+                "menu_id": None,
+                "menu_date": None,
+                "name": restaurant.name,
+                "snippet": restaurant.description[:200],
+                "score": None,
+            }
+            for restaurant in restaurants
+        ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH, [match_query, limit])
+        rows = cursor.fetchall()
+    return [
+        {
+            "type": kind,
+            "restaurant_id": restaurant_id,
+            "menu_id": menu_id,
+            "menu_date": menu_date,
+            "name": name,
+            "snippet": snippet,
+            # bm25() is lower for better matches
+            "score": round(-score, 4),
+        }
+        for kind, restaurant_id, menu_id, menu_date, name, snippet, score in rows
+    ]
@@ -28,6 +28,8 @@ class UploadMenuSerializer(serializers.ModelSerializer):
 
 
 class MenuSerializer(serializers.ModelSerializer):
+    votes = serializers.IntegerField(source="vote_total", read_only=True)
+
     class Meta:
         model = Menu
         fields = ["id", "restaurant", "file", "votes", "created_at", "updated_at"]
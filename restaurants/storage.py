@@ -0,0 +1,96 @@
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 digest of
+    its content, keeping the extension: ``menus/<digest>.pdf``. Saving bytes
+    that are already stored reuses the existing file.
+
+    Uploads are hashed chunk by chunk while they are written to a temporary
+    file next to their final location, so they are never held in memory.
+    Uploads that Django already spooled to a temporary file are hashed in
+    place and moved only when their content is new.
+    """
+
+    chunk_size = 64 * 1024
+
+    def digest(self, name):
+        """
+        Return the SHA-256 hex digest of a file saved by this storage.
+        """
+        return posixpath.splitext(posixpath.basename(name))[0]
+
+    def _content_name(self, name, digest):
+        directory, basename = posixpath.split(name)
+        extension = posixpath.splitext(basename)[1].lower()
+        return posixpath.join(directory, digest + extension)
+
+    def _make_directory(self, directory):
+        if self.directory_permissions_mode is not None:
+            # os.makedirs() does not apply the mode to intermediate directories
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        self._make_directory(directory)
+        sha256 = hashlib.sha256()
+
+        if hasattr(content, "temporary_file_path"):
+            # Already on disk: hash it and only move it when the content is new
+            with open(content.temporary_file_path(), "rb") as source:
+                for chunk in iter(lambda: source.read(self.chunk_size), b""):
+                    sha256.update(chunk)
+            name = self._content_name(name, sha256.hexdigest())
+            if not self.exists(name):
+                try:
+                    file_move_safe(content.temporary_file_path(), self.path(name))
+                except FileExistsError:
+                    # Another upload of the same content was stored meanwhile
+                    pass
+        else:
+            # Stream to a temporary file in the same directory, so it can be
+            # renamed atomically once the digest is known
+            temporary_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+            # os.open() applies the umask like FileSystemStorage does
+            fd = os.open(temporary_path, self.OS_OPEN_FLAGS, 0o666)
+            try:
+                with os.fdopen(fd, "wb") as target:
+                    for chunk in content.chunks(self.chunk_size):
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode("utf-8")
+                        sha256.update(chunk)
+                        target.write(chunk)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+            name = self._content_name(name, sha256.hexdigest())
+            if self.exists(name):
+                os.unlink(temporary_path)
+            else:
+                os.replace(temporary_path, self.path(name))
+
+        if self.file_permissions_mode is not None:
+            os.chmod(self.path(name), self.file_permissions_mode)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Names are chosen from the content in _save(); identical content is
+        # meant to share a name
+        return name
+
+
+def menu_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,211 @@
+import mimetypes
+import re
+import zlib
+
+from .models import Menu
+
+# Leading bytes of the file types menus are uploaded as
+SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+]
+
+# The number of pages under a node of a PDF's page tree, with its /Count
+# before or after its /Type within the same dictionary
+PDF_PAGE_COUNT_RE = re.compile(
+    rb"/Type\s*/Pages(?![a-zA-Z])[^>]*?/Count\s+(\d+)"
+    rb"|/Count\s+(\d+)[^>]*?/Type\s*/Pages(?![a-zA-Z])"
+)
+
+# Bytes kept between the chunks of a PDF so that a page tree node split
+# across two chunks is still found
+PDF_PAGE_COUNT_OVERLAP = 4096
+
+# The start and end of the streams of a PDF, and the strings drawn by the Tj
+# and TJ operators of its content streams
+PDF_STREAM_START_RE = re.compile(rb"(?<!end)stream\r?\n")
+PDF_STREAM_END = b"endstream"
+PDF_TEXT_RE = re.compile(rb"\(((?:\\.|[^\\)])*)\)\s*Tj|\[([^\]]*)\]\s*TJ", re.DOTALL)
+PDF_STRING_RE = re.compile(rb"\(((?:\\.|[^\\)])*)\)", re.DOTALL)
+PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"", b"f": b""}
+
+# The longest text kept from a menu file for the search index
+MAX_FILE_TEXT = 100_000
+
+# The most bytes kept from one PDF stream once decompressed, so that a small
+# deflated stream cannot expand without bound
+MAX_PDF_STREAM = 1024 * 1024
+
+
+def sniff_content_type(header, name):
+    for signature, content_type in SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def unescape_pdf_string(string):
+    return re.sub(
+        rb"\\([0-7]{1,3}|.)",
+        lambda match: (
+            bytes([int(match[1], 8) & 0xFF])
+            if match[1][:1].isdigit()
+            else PDF_ESCAPES.get(match[1], match[1])
+        ),
+        string,
+        flags=re.DOTALL,
+    )
+
+
+class PdfStreamContent:
+    """
+    The content of a PDF stream fed in pieces, inflated when it is deflated
+    and cut at MAX_PDF_STREAM bytes.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.raw = b""
+        self.content = b""
+
+    def feed(self, data):
+        room = MAX_PDF_STREAM - len(self.content)
+        if room <= 0 or not data:
+            return
+        if self.decompressor is None:
+            self.content += data[:room]
+            return
+
+        # The raw bytes are kept until the stream turns out to be deflated
+        if not self.content:
+            self.raw = (self.raw + data)[:MAX_PDF_STREAM]
+        try:
+            self.content += self.decompressor.decompress(data, room)
+        except zlib.error:
+            self.decompressor = None
+            if not self.content:
+                self.content = self.raw
+        if self.content:
+            self.raw = b""
+
+
+def iter_pdf_streams(file, chunk_size=64 * 1024):
+    """
+    Yield the content of every stream of a PDF read from ``file`` in
+    chunks, so that neither the file nor a stream is held whole in memory.
+    """
+    buffer = b""
+    stream = None
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        buffer += chunk
+        while True:
+            if stream is None:
+                match = PDF_STREAM_START_RE.search(buffer)
+                if match is None:
+                    # Keep enough to find a start marker across chunks
+                    buffer = buffer[-len(PDF_STREAM_END) - 2 :]
+                    break
+                buffer = buffer[match.end() :]
+                stream = PdfStreamContent()
+            else:
+                end = buffer.find(PDF_STREAM_END)
+                if end == -1:
+                    # Keep enough to find the end marker across chunks
+                    keep = len(PDF_STREAM_END) - 1
+                    stream.feed(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                    break
+                # The end of line before the marker is not content, which
+                # decompression ignores and text extraction skips
+                stream.feed(buffer[:end])
+                buffer = buffer[end + len(PDF_STREAM_END) :]
+                yield stream.content
+                stream = None
+
+
+def find_page_counts(data):
+    return {int(match[1] or match[2]) for match in PDF_PAGE_COUNT_RE.finditer(data)}
+
+
+def count_pdf_pages(file, chunk_size=64 * 1024):
+    """
+    Return the number of pages of a PDF read from the start of ``file``, or
+    None when its page tree cannot be found. The root of the page tree counts every page, so it is the
+    node with the largest /Count. PDF 1.5 and later may compress the page
+    tree into object streams, so the inflated streams are searched after
+    the file's own bytes.
+    """
+    counts = set()
+    tail = b""
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        # A node found again in the overlap does not change the largest count
+        data = tail + chunk
+        counts.update(find_page_counts(data))
+        tail = data[-PDF_PAGE_COUNT_OVERLAP:]
+
+    file.seek(0)
+    for content in iter_pdf_streams(file, chunk_size):
+        counts.update(find_page_counts(content))
+    return max(counts, default=None)
+
+
+def extract_pdf_text(file):
+    # Good enough for the text of menus exported by office software; fonts
+    # with custom encodings come out garbled and are left to OCR, if ever
+    words = []
+    length = 0
+    for content in iter_pdf_streams(file):
+        for match in PDF_TEXT_RE.finditer(content):
+            if match[1] is not None:
+                strings = [match[1]]
+            else:
+                strings = PDF_STRING_RE.findall(match[2])
+            for string in strings:
+                word = unescape_pdf_string(string)
+                words.append(word)
+                length += len(word) + 1
+        # The rest of the file would be cut from the indexed text anyway
+        if length > MAX_FILE_TEXT:
+            break
+    return b" ".join(words).decode("latin-1")
+
+
+def extract_text(file, content_type):
+    """
+    Return the text of a menu file for the search index: the strings drawn
+    by PDFs and the content of plain text files.
+    """
+    if content_type == "application/pdf":
+        text = extract_pdf_text(file)
+    elif content_type == "text/plain":
+        text = file.read(MAX_FILE_TEXT * 4).decode("utf-8", errors="replace")
+    else:
+        return ""
+    return " ".join(text.split())[:MAX_FILE_TEXT]
+
+
+def process_menu_upload(menu_id):
+    """
+    Post-upload processing of a menu file, run by a job worker: record the
+    content type sniffed from the file, the number of pages of PDFs and the
+    text indexed for search.
+    """
+    menu = Menu.objects.filter(id=menu_id).only("file").first()
+    if menu is None or not menu.file:
+        return
+
+    with menu.file.open("rb") as file:
+        content_type = sniff_content_type(file.read(16), menu.file.name)
+        page_count = None
+        if content_type == "application/pdf":
+            file.seek(0)
+            page_count = count_pdf_pages(file)
+        file.seek(0)
+        file_text = extract_text(file, content_type)
+
+    # The search index is updated by a trigger on file_text
+    Menu.objects.filter(id=menu_id).update(
+        file_content_type=content_type, page_count=page_count, file_text=file_text
+    )
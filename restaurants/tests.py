@@ -1,14 +1,35 @@
 import datetime
+import hashlib
+import io
+import os
+import tempfile
+import zlib
+from unittest import mock
 
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
-from restaurants.models import Menu, Restaurant
-from restaurants.serializers import (MenuSerializer, RestaurantSerializer,
-                                     UploadMenuSerializer)
+from jobs.models import Job
+from restaurants.models import Menu, MenuVoteShard, Restaurant
+from restaurants.serializers import (
+    MenuSerializer,
+    RestaurantSerializer,
+    UploadMenuSerializer,
+)
+from restaurants.storage import ContentAddressedStorage
+from restaurants.tasks import (
+    count_pdf_pages,
+    extract_text,
+    iter_pdf_streams,
+    process_menu_upload,
+)
 from user_profiles.models import UserProfile
 
 
@@ -59,7 +80,52 @@ class RestaurantListAPIViewTest(APITestCase):
         url = reverse("restaurant:restaurant-list")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_get_restaurant_list_pages(self):
+        for name in ("Cedar", "Alder", "Birch", "Elm", "Beech"):
+            Restaurant.objects.create(name=name)
+        Restaurant.objects.create(name=None)
+        url = reverse("restaurant:restaurant-list")
+
+        names = []
+        response = self.client.get(url, {"page_size": 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names.extend(restaurant["name"] for restaurant in response.data["results"])
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(names, [None, "Alder", "Beech", "Birch", "Cedar", "Elm"])
+
+        response = self.client.get(url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_restaurant_list_by_prefix(self):
+        for name in ("Bay Leaf", "Basil", "Bazaar", "Curry House"):
+            Restaurant.objects.create(name=name)
+        url = reverse("restaurant:restaurant-list")
+
+        response = self.client.get(url, {"search": "Ba"})
+
+        self.assertEqual(
+            [restaurant["name"] for restaurant in response.data["results"]],
+            ["Basil", "Bay Leaf", "Bazaar"],
+        )
+
+    def test_search_restaurant_list_by_prefix_ending_in_max_code_point(self):
+        Restaurant.objects.create(name="Bay Leaf")
+        url = reverse("restaurant:restaurant-list")
+
+        response = self.client.get(url, {"search": "Ba\U0010ffff"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.get(url, {"search": "\U0010ffff"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
 
 
 class UploadMenuAPIViewTest(APITestCase):
@@ -88,6 +154,13 @@ class UploadMenuAPIViewTest(APITestCase):
         menu = Menu.objects.get()
         self.assertEqual(menu.restaurant, self.restaurant)
 
+        # The file is processed by a background job
+        job = Job.objects.get()
+        self.assertEqual(job.payload, {"menu_id": menu.id})
+        process_menu_upload(**job.payload)
+        menu.refresh_from_db()
+        self.assertEqual(menu.file_content_type, "application/pdf")
+
     def test_upload_menu_already_uploaded(self):
         Menu.objects.create(
             restaurant=self.restaurant, created_at=datetime.date.today()
@@ -102,6 +175,320 @@ class UploadMenuAPIViewTest(APITestCase):
         self.assertEqual(Menu.objects.count(), 1)
 
 
+class MenuFileStorageTest(APITestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_identical_uploads_share_one_file(self):
+        content = b"%PDF-1.4 daily specials"
+        for name in ("Restaurant 1", "Restaurant 2"):
+            restaurant = Restaurant.objects.create(name=name)
+            response = self.client.post(
+                reverse("restaurant:upload-menu"),
+                {
+                    "restaurant": restaurant.id,
+                    "file": SimpleUploadedFile(
+                        f"{name}.PDF", content, content_type="application/pdf"
+                    ),
+                },
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(
+            set(Menu.objects.values_list("file", "file_sha256", "file_size")),
+            {(f"menus/{digest}.pdf", digest, len(content))},
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(self.media_root, "menus")), [f"{digest}.pdf"]
+        )
+
+    def test_spooled_upload_is_moved_once(self):
+        storage = ContentAddressedStorage()
+        names = []
+        for _ in range(2):
+            upload = TemporaryUploadedFile("menu.pdf", "application/pdf", 0, None)
+            upload.write(b"%PDF-1.4 large menu")
+            upload.flush()
+            names.append(storage.save("menus/menu.pdf", upload))
+            upload.close()
+
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(
+            storage.digest(names[0]), hashlib.sha256(b"%PDF-1.4 large menu").hexdigest()
+        )
+        with storage.open(names[0]) as stored:
+            self.assertEqual(stored.read(), b"%PDF-1.4 large menu")
+
+    def test_spooled_upload_stored_concurrently_is_reused(self):
+        storage = ContentAddressedStorage()
+        name = storage.save("menus/menu.pdf", io.BytesIO(b"%PDF-1.4 menu"))
+
+        # The same content lands between the exists() check and the move
+        upload = TemporaryUploadedFile("menu.pdf", "application/pdf", 0, None)
+        upload.write(b"%PDF-1.4 menu")
+        upload.flush()
+        with mock.patch.object(ContentAddressedStorage, "exists", return_value=False):
+            self.assertEqual(storage.save("menus/menu.pdf", upload), name)
+        upload.close()
+
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), b"%PDF-1.4 menu")
+
+
+class MenuTasksTest(TestCase):
+    def test_count_pdf_pages(self):
+        pdf = (
+            b"%PDF-1.4\n1 0 obj << /Type /Pages /Kids [2 0 R 4 0 R] /Count 3 >>\n"
+            b"2 0 obj << /Count 2 /Kids [3 0 R 5 0 R] /Type /Pages /Parent 1 0 R >>\n"
+            b"3 0 obj << /Type /Page /Parent 2 0 R >>\n"
+            b"4 0 obj << /Type/Page /Parent 1 0 R >>\n"
+            b"5 0 obj << /Type /Page /Parent 2 0 R >>"
+        )
+        for chunk_size in range(1, len(pdf) + 1):
+            self.assertEqual(count_pdf_pages(io.BytesIO(pdf), chunk_size), 3)
+
+    def test_count_pdf_pages_in_object_streams(self):
+        # PDF 1.5 files may compress their page tree into an object stream
+        objects = zlib.compress(
+            b"1 0 2 52 << /Type /Pages /Kids [2 0 R 3 0 R] /Count 2 >> "
+            b"<< /Type /Page /Parent 1 0 R >>"
+        )
+        pdf = (
+            b"%PDF-1.5\n6 0 obj << /Type /ObjStm /N 2 /Filter /FlateDecode >>\n"
+            b"stream\n" + objects + b"\nendstream\nendobj"
+        )
+        self.assertEqual(count_pdf_pages(io.BytesIO(pdf)), 2)
+
+        # A file without a page tree has no known page count
+        self.assertIsNone(count_pdf_pages(io.BytesIO(b"%PDF-1.5\n")))
+
+    def test_extract_text(self):
+        content = zlib.compress(
+            b"BT /F1 12 Tf (Chicken) Tj [(Bir) -20 (yani)] TJ ET\n"
+            b"BT (Dal \\(v\\341gan\\)) Tj ET"
+        )
+        pdf = b"%PDF-1.4\n4 0 obj << >>\nstream\n" + content + b"\nendstream"
+        self.assertEqual(
+            extract_text(io.BytesIO(pdf), "application/pdf"),
+            "Chicken Bir yani Dal (v\xe1gan)",
+        )
+        self.assertEqual(
+            extract_text(io.BytesIO(b"Paneer\n  tikka"), "text/plain"), "Paneer tikka"
+        )
+        self.assertEqual(extract_text(io.BytesIO(b"\x89PNG"), "image/png"), "")
+
+    def test_pdf_streams_are_read_in_chunks(self):
+        pdf = (
+            b"1 0 obj << >>\nstream\n" + zlib.compress(b"(Naan) Tj") + b"\nendstream\n"
+            b"2 0 obj << >>\nstream\r\n(Raita) Tj\r\nendstream\n"
+        )
+        for chunk_size in range(1, len(pdf) + 1):
+            streams = iter_pdf_streams(io.BytesIO(pdf), chunk_size)
+            self.assertEqual(
+                [content.strip() for content in streams], [b"(Naan) Tj", b"(Raita) Tj"]
+            )
+
+    @mock.patch("restaurants.tasks.MAX_PDF_STREAM", 1000)
+    def test_pdf_stream_decompression_is_bounded(self):
+        content = zlib.compress(b"(Naan) Tj " * 100_000)
+        pdf = b"1 0 obj << >>\nstream\n" + content + b"\nendstream"
+
+        streams = list(iter_pdf_streams(io.BytesIO(pdf)))
+
+        self.assertEqual(len(streams[0]), 1000)
+
+
+class RestaurantSearchAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        # A real token, so the query budget covers authentication
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.url = reverse("restaurant:restaurant-search")
+        self.restaurant1 = Restaurant.objects.create(
+            name="Green Leaf", description="Vegan salads and bowls"
+        )
+        self.restaurant2 = Restaurant.objects.create(
+            name="Spice Route", description="Curries"
+        )
+        self.menu = Menu.objects.create(
+            restaurant=self.restaurant2, file_text="Chicken biryani, dal makhani"
+        )
+
+    def search(self, query):
+        response = self.client.get(self.url, {"q": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            (result["type"], result["restaurant_id"], result["menu_id"])
+            for result in response.data["results"]
+        ]
+
+    def test_search_restaurants_and_menus(self):
+        self.assertEqual(
+            self.search("vegan"), [("restaurant", self.restaurant1.id, None)]
+        )
+        self.assertEqual(
+            self.search("biryani"), [("menu", self.restaurant2.id, self.menu.id)]
+        )
+        # The last word matches as a prefix
+        self.assertEqual(
+            self.search("chicken bir"), [("menu", self.restaurant2.id, self.menu.id)]
+        )
+        # Menus are found by their restaurant's name too, and rank below it
+        self.assertEqual(
+            self.search("spice"),
+            [
+                ("restaurant", self.restaurant2.id, None),
+                ("menu", self.restaurant2.id, self.menu.id),
+            ],
+        )
+
+    def test_search_follows_changes(self):
+        self.restaurant1.description = "Grill"
+        self.restaurant1.save()
+        Menu.objects.filter(id=self.menu.id).update(file_text="Vegan thali")
+        self.assertEqual(
+            self.search("vegan"), [("menu", self.restaurant2.id, self.menu.id)]
+        )
+
+        self.menu.delete()
+        self.restaurant1.delete()
+        self.assertEqual(self.search("vegan grill"), [])
+
+    def test_search_query_syntax_is_ignored(self):
+        self.assertEqual(
+            self.search('"vegan* ('), [("restaurant", self.restaurant1.id, None)]
+        )
+        self.assertEqual(self.search("()"), [])
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM restaurants_search")
+        self.assertEqual(self.search("vegan"), [])
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+
+        self.assertIn("Rebuilt the search index.", out.getvalue())
+        self.assertEqual(
+            self.search("vegan"), [("restaurant", self.restaurant1.id, None)]
+        )
+
+
+class MenuFileAPIViewTest(APITestCase):
+    content = b"%PDF-1.4 0123456789"
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.force_authenticate(self.user)
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name="Restaurant 1"),
+            file=SimpleUploadedFile("menu.pdf", self.content),
+        )
+        self.url = reverse("restaurant:menu-file", args=[self.menu.id])
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()}"'
+
+    def test_download_menu_file(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_download_menu_file_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=9-12")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), b"0123")
+        self.assertEqual(response["Content-Range"], f"bytes 9-12/{len(self.content)}")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+
+        # A range for another version of the file gets the whole file
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=9-12", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+    def test_download_empty_menu_file(self):
+        Menu.objects.filter(pk=self.menu.pk).update(
+            file=self.menu.file.storage.save("menus/empty.pdf", ContentFile(b""))
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], "bytes */0")
+
+    @override_settings(MENU_FILE_SENDFILE="x-accel-redirect")
+    def test_download_menu_file_through_proxy(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/{self.menu.file.name}"
+        )
+        self.assertEqual(response["ETag"], self.etag)
+
+        # The file name is sent as a URI path
+        Menu.objects.filter(pk=self.menu.pk).update(file="menus/menu plan #1.pdf")
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected-media/menus/menu%20plan%20%231.pdf",
+        )
+
+    def test_download_missing_menu_file(self):
+        response = self.client.get(reverse("restaurant:menu-file", args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class GetCurrentDayMenuAPIViewTest(APITestCase):
     def setUp(self):
         self.user = UserProfile.objects.create_user(
@@ -127,3 +514,77 @@ class GetCurrentDayMenuAPIViewTest(APITestCase):
 
         serializer = MenuSerializer([self.menu1, self.menu2], many=True)
         self.assertListEqual(response.data["data"], serializer.data)
+
+    def test_get_current_day_menu_excludes_other_days(self):
+        Menu.objects.create(
+            restaurant=Restaurant.objects.create(name="Restaurant 3"),
+            menu_date=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        url = reverse("restaurant:get-current-day-menu")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [menu["id"] for menu in response.data["data"]],
+            [self.menu1.id, self.menu2.id],
+        )
+
+    @override_settings(DAY_ETAGS=True)
+    def test_get_current_day_menu_not_modified(self):
+        url = reverse("restaurant:get-current-day-menu")
+        etag = self.client.get(url)["ETag"]
+
+        # The validator and the token's user both come from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A new menu for the day changes the validator
+        with self.captureOnCommitCallbacks(execute=True):
+            Menu.objects.create(restaurant=Restaurant.objects.create(name="Other"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]), 3)
+
+
+class MenuVoteShardTest(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name="Test Restaurant")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, votes=2)
+
+    def test_add_votes_spreads_over_shards(self):
+        for _ in range(20):
+            MenuVoteShard.objects.add_votes({self.menu.id: 1})
+
+        menu = Menu.objects.with_vote_totals().get(id=self.menu.id)
+        self.assertEqual(menu.vote_total, 22)
+        self.assertEqual(menu.votes, 2)
+
+    def test_shards_are_created_with_the_menu(self):
+        self.assertEqual(self.menu.vote_shards.count(), 8)
+
+        # A vote is then a single UPDATE
+        with self.assertNumQueries(1):
+            MenuVoteShard.objects.add_votes({self.menu.id: 1})
+
+    def test_menus_without_shards_count_votes_on_the_menu(self):
+        Menu.objects.bulk_create([Menu(restaurant=self.restaurant)])
+        menu = Menu.objects.latest("id")
+
+        MenuVoteShard.objects.add_votes({self.menu.id: 1, menu.id: 3})
+
+        menu.refresh_from_db()
+        self.assertEqual(menu.votes, 3)
+        self.assertFalse(menu.vote_shards.exists())
+        self.assertEqual(
+            Menu.objects.with_vote_totals().get(id=self.menu.id).vote_total, 3
+        )
+
+    def test_compact_vote_shards(self):
+        MenuVoteShard.objects.add_votes({self.menu.id: 3})
+        MenuVoteShard.objects.add_votes({self.menu.id: 2})
+
+        call_command("compact_vote_shards", stdout=io.StringIO())
+
+        menu = Menu.objects.with_vote_totals().get(id=self.menu.id)
+        self.assertEqual(menu.votes, 7)
+        self.assertEqual(menu.vote_total, 7)
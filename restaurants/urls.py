@@ -1,7 +1,8 @@
 from django.urls import path
 
 from .views import (CreateRestaurantAPIView, GetCurrentDayMenuAPIView,
-                    RestaurantListAPIView, UploadMenuAPIView)
+                    MenuFileAPIView, RestaurantListAPIView,
+                    RestaurantSearchAPIView, UploadMenuAPIView)
 
 app_name = "restaurant"
 
@@ -9,6 +10,8 @@ urlpatterns = [
     path("create/", CreateRestaurantAPIView.as_view(), name="create-restaurant"),
     path("upload-menu/", UploadMenuAPIView.as_view(), name="upload-menu"),
     path("restaurants/", RestaurantListAPIView.as_view(), name="restaurant-list"),
+    path("search", RestaurantSearchAPIView.as_view(), name="restaurant-search"),
+    path("menus/<int:pk>/file", MenuFileAPIView.as_view(), name="menu-file"),
     path(
         "get-current-day-menus/",
         GetCurrentDayMenuAPIView.as_view(),
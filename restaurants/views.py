@@ -1,13 +1,31 @@
 import datetime
-
+import mimetypes
+import sys
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from jobs.models import Job
+from restaurant_voting_app.versions import day_etag
+
+from . import search
+from .downloads import RangeNotSatisfiable, parse_range, read_range
 from .models import Menu, Restaurant
+from .pagination import KeysetPagination
 from .serializers import (MenuSerializer, RestaurantSerializer,
                           UploadMenuSerializer)
 
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
 
 class CreateRestaurantAPIView(APIView):
     def post(self, request):
@@ -29,11 +47,50 @@ class CreateRestaurantAPIView(APIView):
 
 class RestaurantListAPIView(generics.ListAPIView):
     serializer_class = RestaurantSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        # Retrieve the list of restaurants
+        # Retrieve the list of restaurants, ordered by the paginator
+
+        restaurants = Restaurant.objects.all()
+        search = self.request.query_params.get("search")
+        if search:
+            # A range on the unique name index rather than a LIKE pattern;
+            # the upper bound is the prefix with its last character bumped
+            restaurants = restaurants.filter(name__gte=search)
+            # The largest code point cannot be bumped, so it is dropped and
+            # the character before it bumped instead
+            upper = search.rstrip(chr(sys.maxunicode))
+            if upper:
+                restaurants = restaurants.filter(
+                    name__lt=upper[:-1] + chr(ord(upper[-1]) + 1)
+                )
+        return restaurants
+
+
+class RestaurantSearchAPIView(APIView):
+    def get(self, request):
+        # Search restaurants and the text of their menus, best match first
+
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"error": "'q' is required"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = int(request.query_params.get("limit", SEARCH_LIMIT))
+        except ValueError:
+            return Response(
+                {"error": "'limit' must be a number"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), MAX_SEARCH_LIMIT)
 
-        return Restaurant.objects.order_by("name")
+        return Response(
+            {"query": query, "results": search.search(query, limit)},
+            status=status.HTTP_200_OK,
+        )
 
 
 class UploadMenuAPIView(APIView):
@@ -43,7 +100,7 @@ class UploadMenuAPIView(APIView):
         today = datetime.date.today()
         restaurant_id = request.data.get("restaurant")
         menu_exists = Menu.objects.filter(
-            restaurant__id=restaurant_id, created_at__date=today
+            restaurant__id=restaurant_id, menu_date=today
         ).exists()
 
         if menu_exists:
@@ -57,7 +114,12 @@ class UploadMenuAPIView(APIView):
 
         serializer = UploadMenuSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # Return once the file is stored; it is processed by a worker
+            with transaction.atomic():
+                menu = serializer.save()
+                Job.objects.enqueue(
+                    "restaurants.tasks.process_menu_upload", menu_id=menu.id
+                )
             response_data = {
                 "msg": "Menu uploaded successfully.",
                 "data": serializer.data,
@@ -69,12 +131,18 @@ class UploadMenuAPIView(APIView):
             return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
 
 
+def current_day_menu_etag(request):
+    return day_etag("menus", datetime.date.today())
+
+
 class GetCurrentDayMenuAPIView(APIView):
+    # Polling clients get a 304 without the menus being serialized
+    @method_decorator(condition(etag_func=current_day_menu_etag))
     def get(self, request):
         # Retrieve the current day's menu
 
         today = datetime.date.today()
-        menu = Menu.objects.filter(created_at__date=today)
+        menu = Menu.objects.with_vote_totals().filter(menu_date=today).order_by("id")
         serializer = MenuSerializer(menu, many=True)
         response_data = {
             "msg": "Current day's menu retrieved successfully.",
@@ -82,3 +150,93 @@ class GetCurrentDayMenuAPIView(APIView):
             "success": True,
         }
         return Response(data=response_data, status=status.HTTP_200_OK)
+
+
+class MenuFileAPIView(APIView):
+    """
+    Download the file of a menu. Files never change once stored, so they
+    carry a strong ETag from their digest and may be cached for a long
+    time. Single byte ranges are supported, and with
+    settings.MENU_FILE_SENDFILE the bytes are left to the front proxy.
+    """
+
+    def perform_content_negotiation(self, request, force=False):
+        # The response is the file itself, whatever the Accept header says
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        # Retrieve the menu and check its file
+        menu = Menu.objects.filter(pk=pk).only("file", "file_sha256").first()
+        if menu is None or not menu.file:
+            return Response(
+                {"error": "Menu file not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        etag = f'"{menu.file_sha256}"' if menu.file_sha256 else None
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return self.add_cache_headers(not_modified, etag)
+
+        content_type = mimetypes.guess_type(menu.file.name)[0]
+        content_type = content_type or "application/octet-stream"
+
+        # Let the front proxy stream the file, ranges included
+        sendfile = settings.MENU_FILE_SENDFILE
+        if sendfile:
+            response = HttpResponse(content_type=content_type)
+            if sendfile == "x-accel-redirect":
+                # nginx decodes the URI of the internal redirect
+                response["X-Accel-Redirect"] = (
+                    settings.MENU_FILE_ACCEL_REDIRECT_PREFIX + quote(menu.file.name)
+                )
+            else:
+                response["X-Sendfile"] = menu.file.path
+            return self.add_cache_headers(response, etag)
+
+        try:
+            file = menu.file.open("rb")
+        except FileNotFoundError:
+            return Response(
+                {"error": "Menu file not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        size = menu.file.size
+
+        # A stale If-Range gets the whole file
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        if if_range is None or (etag is not None and if_range == etag):
+            try:
+                byte_range = parse_range(request.headers.get("Range"), size)
+            except RangeNotSatisfiable:
+                file.close()
+                response = HttpResponse(
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+                )
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(file, start, end),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+        return self.add_cache_headers(response, etag)
+
+    def add_cache_headers(self, response, etag):
+        if etag is not None:
+            response["ETag"] = etag
+            # Menus need authentication, so only the client may cache them
+            patch_cache_control(
+                response,
+                private=True,
+                max_age=settings.MENU_FILE_CACHE_MAX_AGE,
+                immutable=True,
+            )
+        return response
@@ -0,0 +1,206 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Employee, UserProfile
+
+# Cache key of the id of the employee a user votes as
+EMPLOYEE_CACHE_FORMAT = "auth:employee:{user}"
+
+MISSING = object()
+
+
+class TokenUserCache:
+    """
+    Users of authentication tokens, in a bounded LRU of this process in
+    front of the shared cache.
+
+    Entries live settings.TOKEN_AUTH_CACHE_TTL seconds in the shared cache
+    and settings.TOKEN_AUTH_LOCAL_CACHE_TTL seconds in the LRU, which holds
+    at most settings.TOKEN_AUTH_LOCAL_CACHE_SIZE tokens. Evicting a token
+    removes it from the shared cache and the LRU of this process; other
+    processes drop it when their local entry expires.
+
+    Only the fields of a user in ``fields`` and its employee id are cached,
+    never its password hash, and each lookup builds a user of its own with
+    just those. A change to them is only seen once the user's tokens are
+    evicted. Saving a user does that through a signal, but
+    QuerySet.update() sends none: code deactivating users that way must
+    call signals.evict_user() for each of them, or the users stay
+    authenticated for up to TOKEN_AUTH_CACHE_TTL.
+    """
+
+    cache_format = "auth:token:{digest}"
+    fields = ("id", "is_active", "is_staff")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def cache_key(self, key):
+        # Token keys are credentials; only their digest goes to the cache
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.cache_format.format(digest=digest)
+
+    def pack(self, user):
+        entry = {field: getattr(user, field) for field in self.fields}
+        entry["employee_id"] = user.cached_employee_id
+        return entry
+
+    def unpack(self, entry):
+        user = UserProfile(**{field: entry[field] for field in self.fields})
+        user.cached_employee_id = entry["employee_id"]
+        return user
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set_local(self, key, entry):
+        expires = time.monotonic() + settings.TOKEN_AUTH_LOCAL_CACHE_TTL
+        with self.lock:
+            self.entries[key] = (entry, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_AUTH_LOCAL_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        entry = self.get_local(key)
+        if entry is None:
+            entry = cache.get(self.cache_key(key))
+            if entry is None:
+                return None
+            self.set_local(key, entry)
+        return self.unpack(entry)
+
+    def set(self, key, user):
+        entry = self.pack(user)
+        cache.set(self.cache_key(key), entry, settings.TOKEN_AUTH_CACHE_TTL)
+        self.set_local(key, entry)
+
+    def evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        cache.delete(self.cache_key(key))
+
+    def clear_local(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_users = TokenUserCache()
+
+
+def user_employee_ids(user_ref="pk"):
+    # The first employee of the user, as a subquery on the user's id
+    return Subquery(
+        Employee.objects.filter(user_id=OuterRef(user_ref))
+        .order_by("id")
+        .values("id")[:1]
+    )
+
+
+def token_with_user(key):
+    # The token, its user and the user's employee in one query
+    return (
+        Token.objects.select_related("user")
+        .annotate(user_employee_id=user_employee_ids("user_id"))
+        .filter(key=key)
+    )
+
+
+def user_from_token(token):
+    # The employee is cached along with the user
+    user = token.user
+    user.cached_employee_id = token.user_employee_id
+    return user
+
+
+def get_employee_id(user):
+    """
+    Return the id of the employee ``user`` votes as, or None when the user
+    is not an employee. Users authenticated with a token carry it from
+    authentication; others are looked up through the shared cache.
+    """
+    if hasattr(user, "cached_employee_id"):
+        return user.cached_employee_id
+    key = EMPLOYEE_CACHE_FORMAT.format(user=user.pk)
+    employee_id = cache.get(key, MISSING)
+    if employee_id is MISSING:
+        employee_id = (
+            Employee.objects.filter(user_id=user.pk)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        cache.set(key, employee_id, settings.TOKEN_AUTH_CACHE_TTL)
+    user.cached_employee_id = employee_id
+    return employee_id
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves tokens through token_users, so that
+    repeated requests with the same token do not query the database. The
+    user's employee is resolved in the same query and cached with it.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_users.get(key)
+        if user is None:
+            token = token_with_user(key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            user = user_from_token(token)
+            token_users.set(key, user)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        # The token is not read again; its key is all callers need
+        return (user, Token(key=key, user=user))
+
+
+def authenticate(request):
+    """
+    Resolve the user of a plain Django request with the API's
+    DEFAULT_AUTHENTICATION_CLASSES. Returns None when the credentials are
+    missing or invalid.
+    """
+    drf_request = Request(
+        request,
+        authenticators=[
+            authenticator()
+            for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    )
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    if not user.is_authenticated:
+        return None
+    return user
+
+
+# The whole authentication, cache lookups included, takes one thread hop
+aauthenticate = sync_to_async(authenticate)
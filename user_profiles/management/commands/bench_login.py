@@ -0,0 +1,101 @@
+import json
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from user_profiles.models import UserProfile
+from user_profiles.views import AUTH_MODES, issue_credentials
+
+
+class Command(BaseCommand):
+    help = (
+        "Log a synthetic user in repeatedly with each ?auth= mode and report "
+        "the latency and queries per login, the cost of issuing the "
+        "credentials alone and the cost of the password check every mode pays."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--logins", type=int, default=50, help="Logins per auth mode."
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file instead of stdout."
+        )
+
+    def handle(self, *args, **options):
+        if options["logins"] < 1:
+            raise CommandError("--logins must be at least 1.")
+
+        run_id = uuid.uuid4().hex[:8]
+        password = uuid.uuid4().hex
+        user = UserProfile.objects.create_user(
+            username=f"bench-{run_id}",
+            email=f"bench-{run_id}@example.com",
+            password=password,
+        )
+        try:
+            report = self.run(user, password, options["logins"])
+        finally:
+            # Deleting the user cascades to its token
+            user.delete()
+
+        report["run_id"] = run_id
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as target:
+                target.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run(self, user, password, logins):
+        client = APIClient(SERVER_NAME="localhost", raise_request_exception=False)
+        url = reverse("login")
+        body = {"username": user.username, "password": password}
+
+        password_check = []
+        for _ in range(logins):
+            started = time.perf_counter()
+            user.check_password(password)
+            password_check.append((time.perf_counter() - started) * 1000)
+
+        # "both" is what every login issued before ?auth= existed
+        modes = {}
+        for mode in AUTH_MODES:
+            latencies = []
+            issue = []
+            queries = 0
+            for _ in range(logins):
+                started = time.perf_counter()
+                issue_credentials(user, mode)
+                issue.append((time.perf_counter() - started) * 1000)
+
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.post(f"{url}?auth={mode}", body)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f"Login with ?auth={mode} failed: {response.status_code}"
+                    )
+                queries += len(captured)
+            modes[mode] = {
+                "logins": logins,
+                "latency_ms": {
+                    "p50": round(statistics.median(latencies), 3),
+                    "max": round(max(latencies), 3),
+                },
+                "credentials_ms": round(statistics.median(issue), 3),
+                "queries_per_login": round(queries / logins, 2),
+            }
+
+        return {
+            "password_check_ms": round(statistics.median(password_check), 3),
+            "modes": modes,
+        }
@@ -1,8 +1,8 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import Employee, Organization, Role, UserProfile
 
@@ -10,6 +10,12 @@ User = get_user_model()
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    """
+    Serializes a user along with a fresh pair of JWTs. The JWTs are only
+    signed when the "auth" context, settings.LOGIN_AUTH_MODE by default,
+    asks for them.
+    """
+
     tokens = serializers.SerializerMethodField()
 
     class Meta:
@@ -25,9 +31,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         )
         return user
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get("auth", settings.LOGIN_AUTH_MODE) == "token":
+            del fields["tokens"]
+        return fields
+
     def get_tokens(self, user):
-        refresh = RefreshToken.for_user(user)
-        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+        return user.tokens()
 
 
 class RoleSerializer(serializers.ModelSerializer):
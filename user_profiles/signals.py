@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import EMPLOYEE_CACHE_FORMAT, token_users
+from .models import Employee, UserProfile
+
+
+def evict_user(user_id):
+    # Drop the cached user behind each of the user's tokens, and the user's
+    # employee
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        token_users.evict(key)
+    cache.delete(EMPLOYEE_CACHE_FORMAT.format(user=user_id))
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    token_users.evict(instance.key)
+
+
+@receiver(post_save, sender=UserProfile)
+def evict_user_tokens(sender, instance, created, **kwargs):
+    # The cached user would otherwise stay active or keep stale fields
+    if not created:
+        evict_user(instance.pk)
+
+
+@receiver(pre_save, sender=Employee)
+def remember_employee_user(sender, instance, **kwargs):
+    # An employee moved to another user must stop voting for the old one
+    instance._previous_user_id = (
+        Employee.objects.filter(pk=instance.pk)
+        .values_list("user_id", flat=True)
+        .first()
+        if instance.pk is not None
+        else None
+    )
+
+
+@receiver([post_save, post_delete], sender=Employee)
+def evict_employee_user(sender, instance, **kwargs):
+    evict_user(instance.user_id)
+    previous_user_id = getattr(instance, "_previous_user_id", None)
+    if previous_user_id not in (None, instance.user_id):
+        evict_user(previous_user_id)
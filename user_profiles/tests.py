@@ -1,10 +1,18 @@
+import io
+import json
+
 from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APITestCase
 
-from user_profiles.models import UserProfile
+from user_profiles import authentication, signals
+from user_profiles.models import Employee, Organization, Role, UserProfile
 
 
 class RegisterAPIViewTest(APITestCase):
@@ -29,6 +37,19 @@ class RegisterAPIViewTest(APITestCase):
         self.assertTrue(user.check_password("testuser@123"))
         self.assertTrue(Token.objects.filter(user=user).exists())
 
+    def test_register_user_with_jwt_only(self):
+        url = reverse("register") + "?auth=jwt"
+        data = {
+            "username": "testuser",
+            "email": "testuser@gmail.com",
+            "password": "testuser@123",
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("access", response.data["tokens"])
+        self.assertNotIn("token", response.data)
+        self.assertFalse(Token.objects.exists())
+
     def test_register_user_missing_fields(self):
         url = reverse("register")
         data = {}  # Missing required fields
@@ -55,6 +76,49 @@ class LoginAPIViewTest(APITestCase):
         self.assertIn("user", response.data)
         self.assertIn("token", response.data)
 
+    def test_login_with_one_credential_type(self):
+        url = reverse("login")
+        data = {
+            "username": "testuser",
+            "password": "testpassword",
+        }
+
+        response = self.client.post(url + "?auth=jwt", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("refresh", response.data["user"]["tokens"])
+        self.assertNotIn("token", response.data)
+        self.assertFalse(Token.objects.exists())
+
+        response = self.client.post(url + "?auth=token", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("tokens", response.data["user"])
+        self.assertEqual(response.data["token"], Token.objects.get(user=self.user).key)
+
+        response = self.client.post(url + "?auth=saml", data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(LOGIN_AUTH_MODE="token")
+    def test_login_default_auth_mode(self):
+        response = self.client.post(
+            reverse("login"), {"username": "testuser", "password": "testpassword"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"user", "token"})
+        self.assertNotIn("tokens", response.data["user"])
+
+    @override_settings(ALLOWED_HOSTS=["localhost"])
+    def test_bench_login_report(self):
+        stdout = io.StringIO()
+        call_command("bench_login", logins=2, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+
+        self.assertEqual(set(report["modes"]), {"jwt", "token", "both"})
+        self.assertEqual(report["modes"]["jwt"]["queries_per_login"], 1)
+        self.assertIn("credentials_ms", report["modes"]["both"])
+
+        # The synthetic user is removed afterwards
+        self.assertEqual(UserProfile.objects.count(), 1)
+
     def test_login_invalid_credentials(self):
         url = reverse("login")
         data = {
@@ -81,3 +145,114 @@ class LogoutAPIViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {"Message": "User logged out successfully"})
         self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+        # The cached token is evicted along with it
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.token_users.clear_local()
+        self.user = UserProfile.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = authentication.CachedTokenAuthentication()
+
+    def test_token_user_is_cached(self):
+        with self.assertNumQueries(1):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual((user, token.key), (self.user, self.token.key))
+
+        with self.assertNumQueries(0):
+            user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        # Another process finds the user in the shared cache
+        authentication.token_users.clear_local()
+        with self.assertNumQueries(0):
+            self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials("unknown")
+
+    def test_each_request_gets_its_own_user(self):
+        first, _ = self.authentication.authenticate_credentials(self.token.key)
+        second, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertIsNot(first, second)
+
+        first.cached_employee_id = 1
+        self.assertIsNone(authentication.get_employee_id(second))
+
+    def test_password_hash_is_not_cached(self):
+        self.authentication.authenticate_credentials(self.token.key)
+
+        entry = cache.get(authentication.token_users.cache_key(self.token.key))
+        self.assertEqual(
+            entry,
+            {
+                "id": self.user.id,
+                "is_active": True,
+                "is_staff": False,
+                "employee_id": None,
+            },
+        )
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.password, "")
+
+    def test_deactivated_user_is_evicted(self):
+        self.authentication.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_users_updated_in_bulk_stay_cached_until_evicted(self):
+        self.authentication.authenticate_credentials(self.token.key)
+
+        # QuerySet.update() sends no signal to evict the cached user
+        UserProfile.objects.filter(id=self.user.id).update(is_active=False)
+        self.authentication.authenticate_credentials(self.token.key)
+
+        signals.evict_user(self.user.id)
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_employee_is_resolved_with_the_user(self):
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            self.assertIsNone(authentication.get_employee_id(user))
+
+        # A new employee evicts the cached user
+        employee = Employee.objects.create(
+            user=self.user,
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(authentication.get_employee_id(user), employee.id)
+
+        # Users authenticated otherwise go through the shared cache
+        user = UserProfile.objects.get(id=self.user.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(authentication.get_employee_id(user), employee.id)
+        user = UserProfile.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.get_employee_id(user), employee.id)
+
+        employee.delete()
+        self.assertIsNone(
+            authentication.get_employee_id(UserProfile.objects.get(id=self.user.id))
+        )
+
+    @override_settings(TOKEN_AUTH_LOCAL_CACHE_SIZE=2)
+    def test_local_cache_is_bounded(self):
+        for key in ("a", "b", "c"):
+            authentication.token_users.set_local(key, self.user)
+        self.assertEqual(list(authentication.token_users.entries), ["b", "c"])
@@ -1,29 +1,67 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .authentication import CachedTokenAuthentication, token_users
 from .models import Employee, Organization, Role, UserProfile
 from .serializers import EmployeeSerializer, UserProfileSerializer
 
+# Credentials a client may ask for with ?auth=
+AUTH_MODES = ("jwt", "token", "both")
+
+
+def get_auth_mode(request):
+    # The credentials to issue, settings.LOGIN_AUTH_MODE unless the client
+    # asks for one kind; None when the client asks for an unknown kind
+    mode = request.query_params.get("auth", settings.LOGIN_AUTH_MODE)
+    return mode if mode in AUTH_MODES else None
+
+
+def issue_credentials(user, auth_mode):
+    # The user with a JWT pair and/or the user's API token, for a login
+    serializer = UserProfileSerializer(user, context={"auth": auth_mode})
+    credentials = {"user": serializer.data}
+    if auth_mode != "jwt":
+        token, _ = Token.objects.get_or_create(user_id=user.id)
+        credentials["token"] = token.key
+    return credentials
+
+
+def invalid_auth_mode_response():
+    return Response(
+        {"error": f"Invalid auth, use one of {', '.join(AUTH_MODES)}"},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
 
 class RegisterAPIView(CreateAPIView):
     serializer_class = UserProfileSerializer
     queryset = UserProfile.objects.all()
     permission_classes = (AllowAny,)
 
+    def get_serializer_context(self):
+        # JWTs are only signed for clients that use them
+        auth_mode = get_auth_mode(self.request)
+        return {**super().get_serializer_context(), "auth": auth_mode}
+
     def create(self, request, *args, **kwargs):
-        # Create a new user profile and generate a token
+        # Create a new user profile and generate the requested credentials
+
+        auth_mode = get_auth_mode(request)
+        if auth_mode is None:
+            return invalid_auth_mode_response()
 
         response = super().create(request, *args, **kwargs)
         if response.status_code == status.HTTP_201_CREATED:
             user = response.data
-            token, _ = Token.objects.get_or_create(user_id=user["id"])
-            user["token"] = token.key
+            if auth_mode != "jwt":
+                # A new user has no token yet
+                user["token"] = Token.objects.create(user_id=user["id"]).key
             return Response(user, status=status.HTTP_201_CREATED)
         return response
 
@@ -32,17 +70,19 @@ class LoginAPIView(APIView):
     permission_classes = (AllowAny,)
 
     def post(self, request):
-        # Authenticate user and return a token
+        # Authenticate user and return the requested credentials
+
+        auth_mode = get_auth_mode(request)
+        if auth_mode is None:
+            return invalid_auth_mode_response()
 
         data = request.data
         username = data.get("username")
         password = data.get("password")
         user = get_object_or_404(UserProfile, username=username)
         if user.check_password(password):
-            serializer = UserProfileSerializer(user)
-            token, _ = Token.objects.get_or_create(user_id=user.id)
             return Response(
-                {"user": serializer.data, "token": token.key}, status=status.HTTP_200_OK
+                issue_credentials(user, auth_mode), status=status.HTTP_200_OK
             )
         return Response(
             {"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED
@@ -50,13 +90,14 @@ class LoginAPIView(APIView):
 
 
 class LogoutAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = (IsAuthenticated,)
 
     def post(self, request):
         # Delete user's authentication token to log them out
 
-        request.user.auth_token.delete()
+        token_users.evict(request.auth.key)
+        request.auth.delete()
         return Response(
             {"Message": "User logged out successfully"}, status=status.HTTP_200_OK
         )
@@ -64,7 +105,7 @@ class LogoutAPIView(APIView):
 
 class CreateEmployeeAPIView(APIView):
     permission_classes = (IsAuthenticated,)
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def post(self, request):
         # Create a new employee
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Vote
+from .models import DailyMenuTally, DailyWinner, Vote
 
 
 @admin.register(Vote)
@@ -20,3 +20,32 @@ class VoteAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(DailyMenuTally)
+class DailyMenuTallyAdmin(admin.ModelAdmin):
+    list_display = ("menu", "date", "shard", "points_total", "voter_count")
+    list_filter = ("date",)
+    readonly_fields = ("menu", "date", "shard", "points_total", "voter_count")
+    date_hierarchy = "date"
+    ordering = ("-date",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyWinner)
+class DailyWinnerAdmin(admin.ModelAdmin):
+    list_display = ("date", "restaurant", "menu", "points_total", "voter_count")
+    list_filter = ("restaurant",)
+    date_hierarchy = "date"
+    ordering = ("-date",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
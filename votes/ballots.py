@@ -0,0 +1,173 @@
+from datetime import date
+
+from django.db import IntegrityError, transaction
+
+from restaurant_voting_app.versions import invalidate_leaderboard
+from restaurants.models import Menu, MenuVoteShard
+from user_profiles.models import Employee
+
+from .models import DailyMenuTally, Vote
+
+BALLOT_SIZE = 3
+MIN_POINTS = 1
+MAX_POINTS = 3
+
+UNIQUE_VOTE_CONSTRAINT = "unique_vote_per_menu_employee_day"
+
+
+class BallotError(Exception):
+    """
+    Raised when a ballot is rejected. The message is the API error text.
+    """
+
+
+class DuplicateVoteError(BallotError):
+    """
+    Raised when the employee has already voted for a menu of the ballot.
+    """
+
+
+class NotAnEmployeeError(BallotError):
+    """
+    Raised when the voter's employee no longer exists, as happens when it
+    is removed while still cached for the voter's token.
+    """
+
+
+def is_duplicate_vote(error):
+    """
+    Return whether an IntegrityError comes from the one vote per menu, employee
+    and day constraint rather than from a missing menu or employee.
+    """
+    # PostgreSQL reports the constraint by name; SQLite lists its columns and
+    # MySQL names the key in the message
+    diagnostics = getattr(error.__cause__, "diag", None)
+    constraint = getattr(diagnostics, "constraint_name", None)
+    if constraint is not None:
+        return constraint == UNIQUE_VOTE_CONSTRAINT
+    message = str(error)
+    return UNIQUE_VOTE_CONSTRAINT in message or message.startswith(
+        "UNIQUE constraint failed: votes_vote."
+    )
+
+
+def rejected_vote(error, employee_id):
+    # The BallotError to report for an IntegrityError of a vote, or None
+    # when the vote failed for another reason, such as a removed menu
+    if is_duplicate_vote(error):
+        return DuplicateVoteError("You have already voted for this menu today")
+    if not Employee.objects.filter(id=employee_id).exists():
+        return NotAnEmployeeError("Only employees can vote")
+    return None
+
+
+def clean_vote(menu_id, points):
+    """
+    Validate one ballot entry and return it as ``(menu_id, points)``.
+    """
+    if (
+        not menu_id
+        or not points
+        or not isinstance(points, int)
+        or points < MIN_POINTS
+        or points > MAX_POINTS
+    ):
+        raise BallotError("Invalid vote data")
+
+    try:
+        return int(menu_id), points
+    except (TypeError, ValueError):
+        raise BallotError("Invalid menu ID")
+
+
+def parse_ballot(vote_data):
+    """
+    Validate the ``votes`` payload of a new build ballot and return it as a
+    ``{menu_id: points}`` mapping. No database access happens here.
+    """
+    if not isinstance(vote_data, list) or len(vote_data) != BALLOT_SIZE:
+        raise BallotError("Invalid vote data")
+
+    ballot = {}
+    for vote in vote_data:
+        if not isinstance(vote, dict):
+            raise BallotError("Invalid vote data")
+
+        menu_id, points = clean_vote(vote.get("menu_id"), vote.get("points"))
+
+        # A menu can only appear once on a ballot
+        if menu_id in ballot:
+            raise BallotError("Invalid vote data")
+
+        ballot[menu_id] = points
+
+    return ballot
+
+
+def record_vote(menu, employee_id, voted_date=None):
+    """
+    Record a single old build vote for ``menu`` in one transaction.
+    """
+    voted_date = voted_date or date.today()
+
+    try:
+        with transaction.atomic():
+            # Create a vote record for the employee; the unique constraint
+            # rejects a second vote for the same menu on the same day
+            vote = Vote.objects.create(
+                menu=menu, employee_id=employee_id, voted_date=voted_date
+            )
+
+            # Increment the votes count and the day's tally for the menu
+            MenuVoteShard.objects.add_votes({menu.id: vote.points})
+            DailyMenuTally.objects.add_votes([(menu.id, vote.points)], voted_date)
+            invalidate_leaderboard(voted_date)
+    except IntegrityError as error:
+        rejection = rejected_vote(error, employee_id)
+        if rejection is None:
+            raise
+        raise rejection
+
+
+def record_ballot(employee_id, ballot, voted_date=None):
+    """
+    Record a parsed ballot for an employee in a single transaction.
+
+    The number of queries does not depend on the size of the ballot: one to
+    check the menus, one INSERT for all vote rows, one UPDATE for all menu
+    counters and two statements for all day tallies. Duplicate votes are detected by
+    the unique constraint on ``Vote``. Nothing is written if any entry is
+    rejected.
+    """
+    voted_date = voted_date or date.today()
+    menu_ids = list(ballot)
+
+    try:
+        with transaction.atomic():
+            # Check that every menu on the ballot exists
+            if Menu.objects.filter(id__in=menu_ids).count() != len(menu_ids):
+                raise BallotError("Invalid menu ID")
+
+            # Create the vote records for the employee; the unique constraint
+            # rejects menus the employee has already voted for today
+            Vote.objects.bulk_create(
+                [
+                    Vote(
+                        menu_id=menu_id,
+                        employee_id=employee_id,
+                        points=points,
+                        voted_date=voted_date,
+                    )
+                    for menu_id, points in ballot.items()
+                ]
+            )
+
+            # Increment the vote counters and day tallies of every menu
+            MenuVoteShard.objects.add_votes(ballot)
+            DailyMenuTally.objects.add_votes(ballot.items(), voted_date)
+            invalidate_leaderboard(voted_date)
+    except IntegrityError as error:
+        rejection = rejected_vote(error, employee_id)
+        if rejection is None:
+            raise
+        raise rejection
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends that keep their data inside one process
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Leaderboard versions, ETags and vote throttles are only coherent when
+    # every worker process reads and writes the same cache
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Error(
+            f"The default cache ({backend}) is local to each process.",
+            hint="Set REDIS_URL, or run a single worker process.",
+            id="votes.E001",
+        )
+    ]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotentResponse
+
+MAX_KEY_LENGTH = IdempotentResponse._meta.get_field("key").max_length
+
+
+def expiry_cutoff():
+    return timezone.now() - timedelta(seconds=settings.VOTE_IDEMPOTENCY_TTL)
+
+
+def request_fingerprint(build_version, data):
+    # The build version selects the ballot format, so it is part of the request
+    payload = json.dumps([build_version, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_final(status_code):
+    # Successful votes are the outcomes a retry must get back; errors leave
+    # nothing written, so retries run again
+    return status.is_success(status_code)
+
+
+def response_body(response):
+    # DRF responses keep their data; other responses are JSON encoded
+    if hasattr(response, "data"):
+        return response.data
+    return json.loads(response.content)
+
+
+def find_response(user, key):
+    """
+    Return the stored response for ``key``, or None. An expired response is
+    deleted so the key can be used again.
+    """
+    stored = IdempotentResponse.objects.filter(user=user, key=key).first()
+    if stored is not None and stored.created_at < expiry_cutoff():
+        stored.delete()
+        return None
+    return stored
+
+
+def replay(stored, fingerprint, response_class):
+    if stored.request_hash != fingerprint:
+        return response_class(
+            {"error": "Idempotency-Key was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = response_class(stored.body, status=stored.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def run_idempotent(request, key, data, handler, response_class=Response):
+    """
+    Run ``handler()``, which votes with the ``data`` of ``request``, once per
+    Idempotency-Key. The key is reserved before the handler runs, so a
+    concurrent request with the same key waits for this one and gets its
+    response back. A final response is stored in the same transaction as
+    the votes it records; other responses release the key. Retries get the
+    stored response without touching menus or votes. ``response_class``
+    builds the error and replayed responses.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return response_class(
+            {"error": "Invalid Idempotency-Key header"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    fingerprint = request_fingerprint(request.META.get("HTTP_BUILD_VERSION"), data)
+    stored = find_response(request.user, key)
+    if stored is not None:
+        return replay(stored, fingerprint, response_class)
+
+    try:
+        with transaction.atomic():
+            # The unique key makes a concurrent insert wait until this
+            # transaction ends, then fail if the response was stored
+            reserved = IdempotentResponse.objects.create(
+                user=request.user,
+                key=key,
+                request_hash=fingerprint,
+                status_code=status.HTTP_202_ACCEPTED,
+                body={},
+            )
+            response = handler()
+            if not is_final(response.status_code):
+                # Nothing was written, so rolling back only releases the key
+                transaction.set_rollback(True)
+                return response
+            reserved.status_code = response.status_code
+            reserved.body = response_body(response)
+            reserved.save(update_fields=["status_code", "body"])
+    except IntegrityError:
+        # A concurrent request with the same key was stored first; its votes
+        # are kept and this attempt is rolled back
+        stored = find_response(request.user, key)
+        if stored is None:
+            raise
+        return replay(stored, fingerprint, response_class)
+    return response
@@ -0,0 +1,93 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from restaurant_voting_app import metrics
+from restaurant_voting_app.versions import increment, leaderboard_version
+from restaurants.models import Menu
+from restaurants.serializers import MenuSerializer
+
+from .models import DailyMenuTally
+
+HITS_KEY = "leaderboard:hits"
+MISSES_KEY = "leaderboard:misses"
+
+
+def _leaderboard_queryset(day):
+    # The day's menus with their tallies for the day, 0 for menus without votes
+    tally_points = (
+        DailyMenuTally.objects.filter(date=day, menu_id=OuterRef("pk"))
+        .totals()
+        .values("points")
+    )
+    return Menu.objects.filter(menu_date=day).annotate(
+        points_total=Coalesce(Subquery(tally_points), 0)
+    )
+
+
+def _serialize_winners(menus):
+    # Keep the menus with the most points for the day
+    max_points = max((menu.points_total for menu in menus), default=None)
+    highly_voted_menus = []
+    for menu in sorted(menus, key=lambda menu: menu.id):
+        if menu.points_total == max_points:
+            # The tally already holds the menu's total, so the serializer
+            # does not need to query the counter shards
+            menu.vote_total = menu.points_total
+            highly_voted_menus.append(menu)
+    return MenuSerializer(highly_voted_menus, many=True).data
+
+
+def compute_leaderboard(day):
+    """
+    Return the serialized menus with the most votes on ``day``.
+    """
+    return _serialize_winners(list(_leaderboard_queryset(day)))
+
+
+def get_leaderboard(day):
+    """
+    Return ``(menus, cache_hit)`` for ``day``, computing and caching the
+    leaderboard on a miss.
+    """
+    key = f"leaderboard:{day.isoformat()}:{leaderboard_version(day)}"
+    menus = cache.get(key, version=settings.LEADERBOARD_CACHE_VERSION)
+    if menus is not None:
+        increment(HITS_KEY)
+        metrics.LEADERBOARD_CACHE.labels("hit").inc()
+        return menus, True
+
+    increment(MISSES_KEY)
+    metrics.LEADERBOARD_CACHE.labels("miss").inc()
+    menus = compute_leaderboard(day)
+    cache.set(
+        key,
+        menus,
+        timeout=settings.LEADERBOARD_CACHE_TIMEOUT,
+        version=settings.LEADERBOARD_CACHE_VERSION,
+    )
+    return menus, False
+
+
+# The async views read the cache and the database in one thread hop rather
+# than one per call
+aget_leaderboard = sync_to_async(get_leaderboard)
+
+
+def leaderboard_cache_stats():
+    """
+    Return the leaderboard cache hit and miss counters.
+    """
+    counters = cache.get_many(
+        [HITS_KEY, MISSES_KEY], version=settings.LEADERBOARD_CACHE_VERSION
+    )
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else None,
+    }
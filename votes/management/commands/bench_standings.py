@@ -0,0 +1,214 @@
+import json
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from restaurants.models import Menu, Restaurant
+from user_profiles.models import Employee, Organization, Role, UserProfile
+from votes import ranking
+from votes.ballots import BALLOT_SIZE
+from votes.models import Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic ballots over a range of days and time the standings "
+        "endpoint end to end for every ranking method, with the time spent "
+        "loading the ballots and scoring them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--voters", type=int, default=200, help="Number of synthetic employees."
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="Number of days with ballots."
+        )
+        parser.add_argument(
+            "--restaurants",
+            type=int,
+            default=10,
+            help="Number of restaurants, each with one menu a day.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Requests timed per method; the fastest is reported.",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file instead of stdout."
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the seeded data instead of deleting it afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        if options["restaurants"] < BALLOT_SIZE:
+            raise CommandError(f"--restaurants must be at least {BALLOT_SIZE}.")
+        if min(options["voters"], options["days"], options["repeat"]) < 1:
+            raise CommandError("--voters, --days and --repeat must be at least 1.")
+
+        run_id = uuid.uuid4().hex[:8]
+        date_to = date.today() - timedelta(days=1)
+        date_from = date_to - timedelta(days=options["days"] - 1)
+        seeded = self.seed(run_id, date_from, options)
+        try:
+            report = self.run(seeded, date_from, date_to, options)
+        finally:
+            if not options["keep"]:
+                self.cleanup(seeded)
+
+        report["run_id"] = run_id
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as target:
+                target.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def seed(self, run_id, date_from, options):
+        organization = Organization.objects.create(name=f"bench-{run_id}")
+        role = Role.objects.create(name=f"bench-{run_id}")
+        UserProfile.objects.bulk_create(
+            [
+                UserProfile(
+                    username=f"bench-{run_id}-{index}",
+                    email=f"bench-{run_id}-{index}@example.com",
+                )
+                for index in range(options["voters"])
+            ]
+        )
+        # Reload the users as bulk_create does not set ids on every backend
+        users = list(
+            UserProfile.objects.filter(username__startswith=f"bench-{run_id}-")
+        )
+        Employee.objects.bulk_create(
+            [
+                Employee(user=user, organization=organization, role=role)
+                for user in users
+            ]
+        )
+        Restaurant.objects.bulk_create(
+            [
+                Restaurant(name=f"bench-{run_id}-{index}", description="Benchmark")
+                for index in range(options["restaurants"])
+            ]
+        )
+        restaurants = Restaurant.objects.filter(name__startswith=f"bench-{run_id}-")
+        days = [date_from + timedelta(days=day) for day in range(options["days"])]
+        Menu.objects.bulk_create(
+            [
+                Menu(restaurant=restaurant, menu_date=day)
+                for restaurant in restaurants
+                for day in days
+            ]
+        )
+        menus_by_day = {}
+        for menu_id, day in Menu.objects.filter(restaurant__in=restaurants).values_list(
+            "id", "menu_date"
+        ):
+            menus_by_day.setdefault(day, []).append(menu_id)
+
+        # Every voter casts a new build ballot of three menus every day
+        employee_ids = list(
+            Employee.objects.filter(organization=organization).values_list(
+                "id", flat=True
+            )
+        )
+        ballot = list(range(BALLOT_SIZE, 0, -1))
+        for day in days:
+            Vote.objects.bulk_create(
+                [
+                    Vote(
+                        menu_id=menu_id,
+                        employee_id=employee_id,
+                        points=points,
+                        voted_date=day,
+                    )
+                    for employee_id in employee_ids
+                    for menu_id, points in zip(
+                        random.sample(menus_by_day[day], len(ballot)), ballot
+                    )
+                ],
+                batch_size=5000,
+            )
+
+        return {
+            "organization": organization,
+            "role": role,
+            "restaurants": restaurants,
+            "votes": len(employee_ids) * len(days) * len(ballot),
+        }
+
+    def cleanup(self, seeded):
+        # Deleting the seeded roots cascades to menus, votes and employees
+        UserProfile.objects.filter(
+            employee__organization=seeded["organization"]
+        ).delete()
+        seeded["restaurants"].delete()
+        seeded["organization"].delete()
+        seeded["role"].delete()
+
+    def run(self, seeded, date_from, date_to, options):
+        client = APIClient(SERVER_NAME="localhost", raise_request_exception=False)
+        client.force_authenticate(
+            UserProfile.objects.filter(
+                employee__organization=seeded["organization"]
+            ).first()
+        )
+        url = reverse("vote-standings")
+        params = {"from": date_from.isoformat(), "to": date_to.isoformat()}
+
+        methods = {}
+        for method in ranking.METHODS:
+            samples = []
+            for _ in range(options["repeat"]):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url, {**params, "method": method})
+                    latency = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise CommandError(
+                        f"{method} standings failed with {response.status_code}"
+                    )
+                samples.append((latency, len(queries)))
+            latency, query_count = min(samples)
+
+            # The same work outside the request, split into its stages
+            started = time.perf_counter()
+            if method in ("raw", "approval"):
+                totals = ranking.load_totals(date_from, date_to)
+                loaded = time.perf_counter()
+                ranking.score_totals(*totals, method)
+            else:
+                ballots = ranking.load_ballots(date_from, date_to)
+                loaded = time.perf_counter()
+                ranking.rank_restaurants(*ballots, method)
+            scored = time.perf_counter()
+
+            methods[method] = {
+                "request_ms": round(latency * 1000, 2),
+                "queries": query_count,
+                "load_ms": round((loaded - started) * 1000, 2),
+                "scoring_ms": round((scored - loaded) * 1000, 2),
+            }
+
+        return {
+            "voters": options["voters"],
+            "days": options["days"],
+            "restaurants": options["restaurants"],
+            "votes": seeded["votes"],
+            "ballot_entries": ranking.ballot_entries(date_from, date_to).count(),
+            "methods": methods,
+        }
@@ -0,0 +1,274 @@
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from restaurants.models import Menu, Restaurant
+from user_profiles.models import Employee, Organization, Role, UserProfile
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic employees and menus, drive the voting and results "
+        "endpoints from concurrent client threads and report throughput, "
+        "latency percentiles, queries per request and lost counter updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--voters", type=int, default=200, help="Number of synthetic employees."
+        )
+        parser.add_argument(
+            "--menus", type=int, default=4, help="Number of menus to vote on."
+        )
+        parser.add_argument(
+            "--threads", type=int, default=8, help="Number of concurrent clients."
+        )
+        parser.add_argument(
+            "--results-per-vote",
+            type=int,
+            default=1,
+            help="Results requests each client makes after every vote.",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file instead of stdout."
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the seeded data instead of deleting it afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        if options["menus"] < 3:
+            raise CommandError("--menus must be at least 3 for new build ballots.")
+        if options["threads"] < 1 or options["voters"] < 1:
+            raise CommandError("--threads and --voters must be at least 1.")
+
+        run_id = uuid.uuid4().hex[:8]
+        seeded = self.seed(run_id, options["voters"], options["menus"])
+        try:
+            report = self.run(seeded, options)
+        finally:
+            if not options["keep"]:
+                self.cleanup(seeded)
+
+        report["run_id"] = run_id
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as target:
+                target.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def seed(self, run_id, voter_count, menu_count):
+        organization = Organization.objects.create(name=f"bench-{run_id}")
+        role = Role.objects.create(name=f"bench-{run_id}")
+        UserProfile.objects.bulk_create(
+            [
+                UserProfile(
+                    username=f"bench-{run_id}-{index}",
+                    email=f"bench-{run_id}-{index}@example.com",
+                )
+                for index in range(voter_count)
+            ]
+        )
+        # Reload the users as bulk_create does not set ids on every backend
+        users = list(
+            UserProfile.objects.filter(username__startswith=f"bench-{run_id}-")
+        )
+        Employee.objects.bulk_create(
+            [
+                Employee(user=user, organization=organization, role=role)
+                for user in users
+            ]
+        )
+        Token.objects.bulk_create(
+            [Token(user=user, key=Token.generate_key()) for user in users]
+        )
+        restaurant = Restaurant.objects.create(
+            name=f"bench-{run_id}", description="Benchmark restaurant"
+        )
+        Menu.objects.bulk_create(
+            [Menu(restaurant=restaurant) for _ in range(menu_count)]
+        )
+
+        return {
+            "organization": organization,
+            "role": role,
+            "restaurant": restaurant,
+            "menu_ids": list(
+                Menu.objects.filter(restaurant=restaurant).values_list("id", flat=True)
+            ),
+            "voters": list(
+                Employee.objects.filter(organization=organization).values_list(
+                    "id", "user__auth_token__key"
+                )
+            ),
+        }
+
+    def cleanup(self, seeded):
+        # Deleting the seeded roots cascades to menus, votes and employees
+        UserProfile.objects.filter(
+            employee__organization=seeded["organization"]
+        ).delete()
+        seeded["restaurant"].delete()
+        seeded["organization"].delete()
+        seeded["role"].delete()
+
+    def run(self, seeded, options):
+        menu_ids = seeded["menu_ids"]
+        jobs = []
+        for index, (employee_id, token) in enumerate(seeded["voters"]):
+            # Alternate between old and new build clients
+            if index % 2:
+                points = random.sample([1, 2, 3], 3)
+                body = {
+                    "employee_id": employee_id,
+                    "votes": [
+                        {"menu_id": menu_id, "points": point}
+                        for menu_id, point in zip(random.sample(menu_ids, 3), points)
+                    ],
+                }
+                jobs.append(("vote-new", token, body))
+            else:
+                body = {"employee_id": employee_id, "menu_id": random.choice(menu_ids)}
+                jobs.append(("vote-old", token, body))
+
+        slices = [
+            jobs[index :: options["threads"]] for index in range(options["threads"])
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+            samples = [
+                sample
+                for worker_samples in executor.map(
+                    lambda jobs: self.drive(jobs, options["results_per_vote"]), slices
+                )
+                for sample in worker_samples
+            ]
+        elapsed = time.perf_counter() - started
+
+        return {
+            "threads": options["threads"],
+            "voters": len(seeded["voters"]),
+            "menus": len(menu_ids),
+            "elapsed_seconds": round(elapsed, 3),
+            "endpoints": self.summarize(samples, elapsed),
+            "counters": self.check_counters(samples, menu_ids),
+        }
+
+    def drive(self, jobs, results_per_vote):
+        # Runs in a worker thread with its own client and database connection
+        client = APIClient(SERVER_NAME="localhost", raise_request_exception=False)
+        vote_url = reverse("vote-menu")
+        results_url = reverse("winning-menu")
+        samples = []
+        try:
+            for kind, token, body in jobs:
+                client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+                build_version = "new" if kind == "vote-new" else "old"
+                samples.append(
+                    self.timed(
+                        kind,
+                        body,
+                        lambda: client.post(
+                            vote_url,
+                            body,
+                            format="json",
+                            HTTP_BUILD_VERSION=build_version,
+                        ),
+                    )
+                )
+                for _ in range(results_per_vote):
+                    samples.append(
+                        self.timed("results", None, lambda: client.get(results_url))
+                    )
+        finally:
+            connection.close()
+        return samples
+
+    def timed(self, kind, body, send):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = send()
+            latency = time.perf_counter() - started
+        return {
+            "kind": kind,
+            "body": body,
+            "status": response.status_code,
+            "latency": latency,
+            "queries": len(queries),
+        }
+
+    def summarize(self, samples, elapsed):
+        summary = {}
+        for kind in sorted({sample["kind"] for sample in samples}):
+            kind_samples = [sample for sample in samples if sample["kind"] == kind]
+            latencies = sorted(sample["latency"] * 1000 for sample in kind_samples)
+            summary[kind] = {
+                "requests": len(kind_samples),
+                "errors": sum(1 for sample in kind_samples if sample["status"] >= 500),
+                "rejected": sum(
+                    1 for sample in kind_samples if 400 <= sample["status"] < 500
+                ),
+                "throughput_per_second": round(len(kind_samples) / elapsed, 1),
+                "latency_ms": {
+                    "p50": round(percentile(latencies, 50), 2),
+                    "p95": round(percentile(latencies, 95), 2),
+                    "p99": round(percentile(latencies, 99), 2),
+                },
+                "queries_per_request": round(
+                    sum(sample["queries"] for sample in kind_samples)
+                    / len(kind_samples),
+                    2,
+                ),
+            }
+        return summary
+
+    def check_counters(self, samples, menu_ids):
+        # Every accepted vote must be reflected in the menu totals
+        expected = dict.fromkeys(menu_ids, 0)
+        for sample in samples:
+            if sample["status"] != 200 or sample["kind"] == "results":
+                continue
+            if sample["kind"] == "vote-old":
+                expected[sample["body"]["menu_id"]] += 1
+            else:
+                for vote in sample["body"]["votes"]:
+                    expected[vote["menu_id"]] += vote["points"]
+
+        actual = dict(
+            Menu.objects.filter(id__in=menu_ids)
+            .with_vote_totals()
+            .values_list("id", "vote_total")
+        )
+        expected_points = sum(expected.values())
+        lost_points = sum(
+            expected[menu_id] - actual.get(menu_id, 0) for menu_id in menu_ids
+        )
+        return {
+            "expected_points": expected_points,
+            "counted_points": sum(actual.values()),
+            "lost_points": lost_points,
+            "lost_update_rate": (
+                round(lost_points / expected_points, 4) if expected_points else 0
+            ),
+        }
@@ -0,0 +1,247 @@
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from restaurant_voting_app.versions import invalidate_leaderboard
+from restaurants.models import Menu, MenuVoteShard
+from user_profiles.models import Employee
+from votes.ballots import BallotError, is_duplicate_vote, parse_ballot
+from votes.models import DailyMenuTally, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Import ballots collected offline from an NDJSON or CSV file of "
+        "employee_id, menu_id, points and voted_date records. The records of "
+        "a ballot are on consecutive lines, and ballots follow the rules of "
+        "the vote API: exactly one vote for each of BALLOT_SIZE different "
+        "menus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import.")
+        parser.add_argument(
+            "--format",
+            choices=["ndjson", "csv"],
+            help="Input format. Defaults to csv for .csv files, ndjson otherwise.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of ballots written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "ndjson"
+        )
+
+        started = time.monotonic()
+        imported = 0
+        rejected = Counter()
+
+        try:
+            source = open(path, newline="", encoding="utf-8")
+        except OSError as error:
+            raise CommandError(f"Cannot read {path}: {error.strerror}.")
+
+        with source:
+            ballots = self.read_ballots(self.read_records(source, file_format))
+            while True:
+                # Only one chunk is held in memory at a time
+                chunk = list(islice(ballots, options["chunk_size"]))
+                if not chunk:
+                    break
+
+                chunk_imported, rejects = self.import_chunk(chunk)
+                imported += chunk_imported
+                for line_number, reason in rejects:
+                    rejected[reason] += 1
+                    if options["verbosity"] > 1:
+                        self.stderr.write(f"Line {line_number}: {reason}")
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} votes, rejected {sum(rejected.values())} rows "
+                f"in {elapsed:.2f}s ({rate:.0f} votes/sec)."
+            )
+        )
+        for reason, count in rejected.most_common():
+            self.stdout.write(f"  {count} rejected: {reason}")
+
+    def read_records(self, source, file_format):
+        # Yield (line number, record) pairs; unparsable lines give None
+        if file_format == "csv":
+            reader = csv.DictReader(source)
+            for record in reader:
+                points = record.get("points")
+                if points and points.strip().isdigit():
+                    record["points"] = int(points)
+                yield reader.line_num, record
+            return
+
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+    def read_ballots(self, records):
+        # Group consecutive records of the same employee and day into
+        # ballots; a record that is not an object is a ballot of its own
+        ballot = []
+        ballot_key = None
+        for line_number, record in records:
+            if isinstance(record, dict):
+                key = (record.get("employee_id"), record.get("voted_date"))
+            else:
+                key = object()
+            if ballot and key != ballot_key:
+                yield ballot
+                ballot = []
+            ballot.append((line_number, record))
+            ballot_key = key
+        if ballot:
+            yield ballot
+
+    def clean_ballot(self, ballot):
+        # Apply the ballot rules of the vote API and build unsaved votes
+        records = [record for _, record in ballot]
+        points_by_menu = parse_ballot(records)
+
+        try:
+            employee_id = int(records[0].get("employee_id"))
+        except (TypeError, ValueError):
+            raise BallotError("Provide a valid employee ID")
+
+        try:
+            voted_date = date.fromisoformat(records[0].get("voted_date"))
+        except (TypeError, ValueError):
+            raise BallotError("Invalid voted date")
+
+        return [
+            Vote(
+                menu_id=menu_id,
+                employee_id=employee_id,
+                points=points,
+                voted_date=voted_date,
+            )
+            for menu_id, points in points_by_menu.items()
+        ]
+
+    def import_chunk(self, chunk):
+        """
+        Validate and write one chunk of ballots. Returns the number of votes
+        imported and the ``(line number, reason)`` of every rejected record.
+        A ballot is imported whole or rejected whole, as in the vote API.
+        """
+        ballots = []
+        rejects = []
+        for ballot in chunk:
+            line_numbers = [line_number for line_number, _ in ballot]
+            try:
+                ballots.append((line_numbers, self.clean_ballot(ballot)))
+            except BallotError as error:
+                rejects.extend(
+                    (line_number, str(error)) for line_number in line_numbers
+                )
+
+        # Check menus, employees and earlier votes with one query each
+        votes = [vote for _, ballot_votes in ballots for vote in ballot_votes]
+        known_menus = set(
+            Menu.objects.filter(id__in={vote.menu_id for vote in votes}).values_list(
+                "id", flat=True
+            )
+        )
+        known_employees = set(
+            Employee.objects.filter(
+                id__in={vote.employee_id for vote in votes}
+            ).values_list("id", flat=True)
+        )
+        cast_votes = self.find_cast_votes(votes)
+
+        accepted = []
+        for line_numbers, ballot_votes in ballots:
+            keys = [
+                (vote.menu_id, vote.employee_id, vote.voted_date)
+                for vote in ballot_votes
+            ]
+            if any(vote.menu_id not in known_menus for vote in ballot_votes):
+                reason = "Invalid menu ID"
+            elif ballot_votes[0].employee_id not in known_employees:
+                reason = "Provide a valid employee ID"
+            elif any(key in cast_votes for key in keys):
+                reason = "Already voted for this menu that day"
+            else:
+                cast_votes.update(keys)
+                accepted.append((line_numbers, ballot_votes))
+                continue
+            rejects.extend((line_number, reason) for line_number in line_numbers)
+
+        if not accepted:
+            return 0, rejects
+
+        try:
+            self.write_votes(
+                [vote for _, ballot_votes in accepted for vote in ballot_votes]
+            )
+        except IntegrityError:
+            # A conflicting vote was written since the chunk was checked, so
+            # write the ballots one by one to reject only the conflicting ones
+            return self.import_ballots(accepted, rejects)
+
+        return sum(len(ballot_votes) for _, ballot_votes in accepted), rejects
+
+    def import_ballots(self, accepted, rejects):
+        # Write each ballot in its own transaction
+        imported = 0
+        for line_numbers, ballot_votes in accepted:
+            try:
+                self.write_votes(ballot_votes)
+            except IntegrityError as error:
+                if is_duplicate_vote(error):
+                    reason = "Already voted for this menu that day"
+                else:
+                    reason = "Menu or employee removed during import"
+                rejects.extend((line_number, reason) for line_number in line_numbers)
+            else:
+                imported += len(ballot_votes)
+        return imported, rejects
+
+    def find_cast_votes(self, votes):
+        # The (menu, employee, date) keys of the votes already cast
+        return set(
+            Vote.objects.filter(
+                menu_id__in={vote.menu_id for vote in votes},
+                employee_id__in={vote.employee_id for vote in votes},
+                voted_date__in={vote.voted_date for vote in votes},
+            ).values_list("menu_id", "employee_id", "voted_date")
+        )
+
+    def write_votes(self, votes):
+        points_by_menu = Counter()
+        votes_by_day = defaultdict(list)
+        for vote in votes:
+            points_by_menu[vote.menu_id] += vote.points
+            votes_by_day[vote.voted_date].append((vote.menu_id, vote.points))
+
+        with transaction.atomic():
+            Vote.objects.bulk_create(votes)
+
+            # One aggregated counter update, and one tally update per day
+            MenuVoteShard.objects.add_votes(points_by_menu)
+            for voted_date, day_votes in votes_by_day.items():
+                DailyMenuTally.objects.add_votes(day_votes, voted_date)
+                invalidate_leaderboard(voted_date)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from votes.idempotency import expiry_cutoff
+from votes.models import IdempotentResponse
+
+
+class Command(BaseCommand):
+    help = "Delete stored vote responses whose Idempotency-Key has expired."
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotentResponse.objects.filter(
+            created_at__lt=expiry_cutoff()
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired responses."))
@@ -0,0 +1,260 @@
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from restaurant_voting_app.versions import invalidate_leaderboard
+from restaurants.models import Menu, MenuVoteShard
+from votes.models import DailyMenuTally, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute menu vote totals and daily tallies from the vote log and "
+        "fix the ones that have drifted. Votes cast before --since, if given, "
+        "did not store their points, so menus with such votes are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help=(
+                "First day whose votes store their points (YYYY-MM-DD). Menus "
+                "with votes cast earlier are skipped. Defaults to checking "
+                "every menu."
+            ),
+        )
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            type=date.fromisoformat,
+            help="First menu date to check (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            type=date.fromisoformat,
+            help="Last menu date to check (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of menus checked per transaction.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the drift, do not fix it.",
+        )
+
+    def handle(self, *args, **options):
+        menus = Menu.objects.all()
+        if options["date_from"]:
+            menus = menus.filter(menu_date__gte=options["date_from"])
+        if options["date_to"]:
+            menus = menus.filter(menu_date__lte=options["date_to"])
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.monotonic()
+        checked = 0
+        skipped = 0
+        drifted = 0
+        drifted_tallies = 0
+        last_id = 0
+
+        while True:
+            # Each batch covers a contiguous range of menu ids and holds its
+            # locks only for that range. The menu rows are locked like
+            # compact_vote_shards does, and every fix is applied as a delta,
+            # so votes and compactions running meanwhile are kept.
+            with transaction.atomic():
+                batch = list(
+                    menus.filter(id__gt=last_id)
+                    .select_for_update()
+                    .order_by("id")
+                    .only("id", "votes", "menu_date")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                logged = self.read_vote_log([menu.id for menu in batch])
+
+                # Menus with votes from before points were stored cannot be
+                # checked
+                legacy = set()
+                if options["since"]:
+                    legacy = {
+                        menu_id for menu_id, day in logged if day < options["since"]
+                    }
+                checked_menus = [menu for menu in batch if menu.id not in legacy]
+                logged = {
+                    key: totals
+                    for key, totals in logged.items()
+                    if key[0] not in legacy
+                }
+
+                menu_fixes = self.check_menus(checked_menus, logged)
+                tally_fixes = self.check_tallies(
+                    [menu.id for menu in checked_menus], logged
+                )
+
+                if not options["dry_run"]:
+                    self.fix_menus(menu_fixes)
+                    self.fix_tallies(tally_fixes)
+                    # Updates send no signals, so the cached views of the
+                    # fixed days are invalidated here
+                    fixed_days = {
+                        menu.menu_date for menu in batch if menu.id in menu_fixes
+                    }
+                    fixed_days.update(day for _, day in tally_fixes)
+                    for day in fixed_days:
+                        invalidate_leaderboard(day)
+
+            checked += len(checked_menus)
+            skipped += len(batch) - len(checked_menus)
+            drifted += len(menu_fixes)
+            drifted_tallies += len(tally_fixes)
+            if len(batch) < options["batch_size"]:
+                break
+
+        action = "Found" if options["dry_run"] else "Fixed"
+        summary = (
+            f"{action} {drifted} drifted menus and {drifted_tallies} drifted "
+            f"daily tallies out of {checked} menus checked"
+        )
+        if options["since"]:
+            summary += f" ({skipped} with votes before {options['since']} skipped)"
+        self.stdout.write(
+            self.style.SUCCESS(f"{summary} in {time.monotonic() - started:.2f}s.")
+        )
+
+    def read_vote_log(self, menu_ids):
+        """
+        Return the ``{(menu_id, date): (points, voters)}`` totals of the votes
+        cast for the menus, read with a single aggregate query.
+        """
+        return {
+            (menu_id, day): (points, voters)
+            for menu_id, day, points, voters in Vote.objects.filter(
+                menu_id__in=menu_ids
+            )
+            .values("menu_id", "voted_date")
+            .annotate(points=Sum("points"), voters=Count("id"))
+            .values_list("menu_id", "voted_date", "points", "voters")
+        }
+
+    def check_menus(self, menus, logged):
+        """
+        Compare the vote counters of the locked ``menus`` with the vote log.
+        Returns the ``{menu_id: drift}`` corrections of drifted menus.
+        """
+        shard_votes = dict(
+            MenuVoteShard.objects.filter(menu_id__in=[menu.id for menu in menus])
+            .values("menu_id")
+            .annotate(total=Sum("count"))
+            .values_list("menu_id", "total")
+        )
+        logged_points = defaultdict(int)
+        for (menu_id, _), (points, _) in logged.items():
+            logged_points[menu_id] += points
+
+        fixes = {}
+        for menu in menus:
+            counted = menu.votes + shard_votes.get(menu.id, 0)
+            drift = logged_points[menu.id] - counted
+            if not drift:
+                continue
+            self.stdout.write(
+                f"{menu} ({menu.menu_date}): counted {counted}, "
+                f"logged {logged_points[menu.id]}, drift {drift:+d}"
+            )
+            fixes[menu.id] = drift
+        return fixes
+
+    def check_tallies(self, menu_ids, logged):
+        """
+        Compare the daily tallies of the menus, summed over their shards,
+        with the vote log. Returns the ``{(menu_id, date): (points, voters)}``
+        corrections of drifted and missing tallies. The menus are locked
+        before the votes are read, and the tally shards are locked here, so
+        both sides of the comparison hold still until the fixes are written.
+        """
+        counted = defaultdict(lambda: (0, 0))
+        for menu_id, day, points, voters in (
+            DailyMenuTally.objects.filter(menu_id__in=menu_ids)
+            .select_for_update()
+            .values_list("menu_id", "date", "points_total", "voter_count")
+        ):
+            counted_points, counted_voters = counted[menu_id, day]
+            counted[menu_id, day] = (counted_points + points, counted_voters + voters)
+
+        fixes = {}
+        for menu_id, day in sorted(counted.keys() | logged.keys()):
+            counted_points, counted_voters = counted.get((menu_id, day), (0, 0))
+            logged_points, logged_voters = logged.get((menu_id, day), (0, 0))
+            if (counted_points, counted_voters) == (logged_points, logged_voters):
+                continue
+            self.stdout.write(
+                f"Tally of Menu-{menu_id} on {day}: counted {counted_points} "
+                f"points from {counted_voters} votes, logged {logged_points} "
+                f"from {logged_voters}"
+            )
+            fixes[menu_id, day] = (
+                logged_points - counted_points,
+                logged_voters - counted_voters,
+            )
+        return fixes
+
+    def fix_menus(self, fixes):
+        # Add the drift of every menu with a single UPDATE
+        if not fixes:
+            return
+        Menu.objects.filter(id__in=fixes).update(
+            votes=F("votes")
+            + Case(
+                *[
+                    When(id=menu_id, then=Value(drift))
+                    for menu_id, drift in fixes.items()
+                ],
+                default=Value(0),
+            )
+        )
+
+    def fix_tallies(self, fixes):
+        # The drift is added to the first shard of each tally, created when
+        # missing; a vote may update the tally meanwhile, so the drift is
+        # added to the row rather than written over it
+        if not fixes:
+            return
+        DailyMenuTally.objects.bulk_create(
+            [DailyMenuTally(menu_id=menu_id, date=day) for menu_id, day in fixes],
+            ignore_conflicts=True,
+        )
+        tally_filter = Q()
+        for menu_id, day in fixes:
+            tally_filter |= Q(menu_id=menu_id, date=day)
+        DailyMenuTally.objects.filter(tally_filter, shard=0).update(
+            points_total=F("points_total")
+            + Case(
+                *[
+                    When(menu_id=menu_id, date=day, then=Value(points))
+                    for (menu_id, day), (points, _) in fixes.items()
+                ],
+                default=Value(0),
+            ),
+            voter_count=F("voter_count")
+            + Case(
+                *[
+                    When(menu_id=menu_id, date=day, then=Value(voters))
+                    for (menu_id, day), (_, voters) in fixes.items()
+                ],
+                default=Value(0),
+            ),
+        )
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from votes.models import DailyMenuTally, DailyWinner
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the winning menus of days whose voting has closed. Run after "
+        "midnight to close the previous day, or with --backfill to record "
+        "every past day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            type=date.fromisoformat,
+            help="First day to record (YYYY-MM-DD). Defaults to yesterday.",
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            type=date.fromisoformat,
+            help="Last day to record (YYYY-MM-DD). Defaults to yesterday.",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Record every day from the first vote up to yesterday.",
+        )
+
+    def handle(self, *args, **options):
+        yesterday = date.today() - timedelta(days=1)
+        date_to = options["date_to"] or yesterday
+        date_from = options["date_from"] or yesterday
+        if options["backfill"]:
+            date_from = (
+                DailyMenuTally.objects.aggregate(first=Min("date"))["first"] or date_to
+            )
+
+        # Today's voting is still open
+        if date_to > yesterday:
+            raise CommandError("--to must be before today.")
+        if date_from > date_to:
+            raise CommandError("--from must not be after --to.")
+
+        recorded = DailyWinner.objects.record(date_from, date_to)
+        for day in DailyWinner.objects.days_without_winner(date_from, date_to):
+            self.stdout.write(
+                self.style.WARNING(f"No winner on {day}: no votes for its menus.")
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recorded {recorded} winners from {date_from} to {date_to}."
+            )
+        )
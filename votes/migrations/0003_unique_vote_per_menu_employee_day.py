@@ -0,0 +1,48 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:22
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    # Keep the earliest vote of every (menu, employee, voted_date) group, and
+    # take the points of the removed votes off their menu's counter
+    Menu = apps.get_model("restaurants", "Menu")
+    Vote = apps.get_model("votes", "Vote")
+    duplicates = (
+        Vote.objects.values("menu", "employee", "voted_date")
+        .annotate(first_id=Min("id"), vote_count=Count("id"))
+        .filter(vote_count__gt=1)
+    )
+    removed_points = defaultdict(int)
+    for duplicate in duplicates.iterator():
+        removed = Vote.objects.filter(
+            menu=duplicate["menu"],
+            employee=duplicate["employee"],
+            voted_date=duplicate["voted_date"],
+        ).exclude(id=duplicate["first_id"])
+        removed_points[duplicate["menu"]] += (
+            removed.aggregate(points=Sum("points"))["points"] or 0
+        )
+        removed.delete()
+    for menu_id, points in removed_points.items():
+        Menu.objects.filter(id=menu_id).update(votes=F("votes") - points)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("votes", "0002_rename_votes_vote_points"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("menu", "employee", "voted_date"),
+                name="unique_vote_per_menu_employee_day",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("votes", "0003_unique_vote_per_menu_employee_day"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(
+                fields=["voted_date", "menu"], name="vote_date_menu_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_daily_tallies(apps, schema_editor):
+    # Each menu's votes on each day go to the first shard of its tally
+    Vote = apps.get_model("votes", "Vote")
+    DailyMenuTally = apps.get_model("votes", "DailyMenuTally")
+
+    day_votes = (
+        Vote.objects.order_by()
+        .values("menu_id", "voted_date")
+        .annotate(points=Sum("points"), voters=Count("id"))
+        .values_list("menu_id", "voted_date", "points", "voters")
+    )
+    DailyMenuTally.objects.bulk_create(
+        (
+            DailyMenuTally(
+                menu_id=menu_id,
+                date=voted_date,
+                points_total=points,
+                voter_count=voters,
+            )
+            for menu_id, voted_date, points, voters in day_votes.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0002_menu_menu_date"),
+        ("votes", "0004_vote_date_menu_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyMenuTally",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Date")),
+                ("shard", models.PositiveSmallIntegerField(default=0)),
+                ("points_total", models.IntegerField(default=0)),
+                ("voter_count", models.IntegerField(default=0)),
+                (
+                    "menu",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_tallies",
+                        to="restaurants.menu",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailymenutally",
+            constraint=models.UniqueConstraint(
+                fields=("date", "menu", "shard"),
+                name="unique_daily_menu_tally_shard",
+            ),
+        ),
+        migrations.RunPython(backfill_daily_tallies, migrations.RunPython.noop),
+    ]
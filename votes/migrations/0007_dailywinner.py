@@ -0,0 +1,56 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("restaurants", "0003_menuvoteshard"),
+        ("votes", "0006_idempotentresponse"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyWinner",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Date")),
+                ("points_total", models.IntegerField()),
+                ("voter_count", models.IntegerField()),
+                (
+                    "menu",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="wins",
+                        to="restaurants.menu",
+                    ),
+                ),
+                (
+                    "restaurant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_wins",
+                        to="restaurants.restaurant",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date", "menu"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailywinner",
+            constraint=models.UniqueConstraint(
+                fields=("date", "menu"), name="unique_daily_winner"
+            ),
+        ),
+    ]
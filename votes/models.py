@@ -1,8 +1,15 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Sum, Value, When, Window
+from django.db.models.functions import Rank
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
-from restaurants.models import Menu
+from restaurants.models import Menu, Restaurant
 from user_profiles.models import Employee
 
 
@@ -14,5 +21,225 @@ class Vote(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     voted_date = models.DateField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            # An employee can vote for a menu only once per day
+            models.UniqueConstraint(
+                fields=["menu", "employee", "voted_date"],
+                name="unique_vote_per_menu_employee_day",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["voted_date", "menu"], name="vote_date_menu_idx"),
+        ]
+
     def __str__(self):
         return f"Votes for Menu {self.menu.id} by Employee {self.employee.id}"
+
+
+class DailyMenuTallyQuerySet(models.QuerySet):
+    def totals(self):
+        """
+        Sum the shards of each menu's tally for each day into
+        ``{"menu_id", "date", "points", "voters"}`` rows.
+        """
+        return (
+            self.order_by()
+            .values("menu_id", "date")
+            .annotate(points=Sum("points_total"), voters=Sum("voter_count"))
+        )
+
+
+class DailyMenuTallyManager(models.Manager.from_queryset(DailyMenuTallyQuerySet)):
+    def add_votes(self, votes, day):
+        """
+        Add ``(menu_id, points)`` votes cast on ``day`` to the day's tallies of
+        their menus. Two queries are run however many votes are given.
+
+        Each menu gets one randomly chosen shard of its tally incremented,
+        like MenuVoteShard, so concurrent voters for the same menu rarely
+        contend for the same row.
+        """
+        totals = {}
+        for menu_id, points in votes:
+            points_total, voter_count = totals.get(menu_id, (0, 0))
+            totals[menu_id] = (points_total + points, voter_count + 1)
+
+        chosen_shards = {
+            menu_id: random.randrange(settings.DAILY_TALLY_SHARDS) for menu_id in totals
+        }
+
+        # Make sure the chosen shard of every tally exists
+        self.bulk_create(
+            [
+                self.model(menu_id=menu_id, date=day, shard=shard)
+                for menu_id, shard in chosen_shards.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+        shard_filter = Q()
+        for menu_id, shard in chosen_shards.items():
+            shard_filter |= Q(menu_id=menu_id, shard=shard)
+
+        self.filter(shard_filter, date=day).update(
+            points_total=F("points_total")
+            + Case(
+                *[
+                    When(menu_id=menu_id, then=Value(points_total))
+                    for menu_id, (points_total, _) in totals.items()
+                ],
+                default=Value(0),
+            ),
+            voter_count=F("voter_count")
+            + Case(
+                *[
+                    When(menu_id=menu_id, then=Value(voter_count))
+                    for menu_id, (_, voter_count) in totals.items()
+                ],
+                default=Value(0),
+            ),
+        )
+
+
+class DailyMenuTally(models.Model):
+    """
+    Part of the running totals of a menu's votes cast on a day, kept in the
+    same transaction as the votes themselves. A menu's totals for the day
+    are the sums over its shards; see DailyMenuTallyQuerySet.totals().
+    """
+
+    menu = models.ForeignKey(
+        Menu, on_delete=models.CASCADE, related_name="daily_tallies"
+    )
+    date = models.DateField(verbose_name=_("Date"))
+    shard = models.PositiveSmallIntegerField(default=0)
+    points_total = models.IntegerField(default=0)
+    voter_count = models.IntegerField(default=0)
+
+    objects = DailyMenuTallyManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "menu", "shard"], name="unique_daily_menu_tally_shard"
+            )
+        ]
+
+    def __str__(self):
+        return f"Tally {self.shard} for Menu {self.menu_id} on {self.date}"
+
+
+class DailyWinnerManager(models.Manager):
+    def record(self, date_from, date_to):
+        """
+        Record the winners of every closed day from ``date_from`` to
+        ``date_to``, replacing winners recorded earlier for those days. Only
+        the menus served on a day can win it. The winners of all days are
+        found with a single window function query. Returns the number of
+        winners recorded.
+        """
+        winners = (
+            DailyMenuTally.objects.filter(
+                date__range=(date_from, date_to), menu__menu_date=F("date")
+            )
+            .values("date", "menu_id", "menu__restaurant_id")
+            .annotate(points=Sum("points_total"), voters=Sum("voter_count"))
+            .annotate(
+                rank=Window(
+                    expression=Rank(),
+                    partition_by=[F("date")],
+                    order_by=F("points").desc(),
+                )
+            )
+            .filter(rank=1)
+            .values_list("date", "menu_id", "menu__restaurant_id", "points", "voters")
+        )
+        with transaction.atomic():
+            self.filter(date__range=(date_from, date_to)).delete()
+            created = self.bulk_create(
+                [
+                    self.model(
+                        date=day,
+                        menu_id=menu_id,
+                        restaurant_id=restaurant_id,
+                        points_total=points_total,
+                        voter_count=voter_count,
+                    )
+                    for day, menu_id, restaurant_id, points_total, voter_count in (
+                        winners
+                    )
+                ]
+            )
+        return len(created)
+
+    def days_without_winner(self, date_from, date_to):
+        """
+        Return the days from ``date_from`` to ``date_to`` that have no
+        recorded winner, such as days without votes.
+        """
+        won = set(
+            self.filter(date__range=(date_from, date_to)).values_list("date", flat=True)
+        )
+        return [
+            day
+            for day in (
+                date_from + timedelta(days=offset)
+                for offset in range((date_to - date_from).days + 1)
+            )
+            if day not in won
+        ]
+
+
+class DailyWinner(models.Model):
+    """
+    A menu with the most points on a day whose voting has closed. Tied menus
+    are all recorded.
+    """
+
+    date = models.DateField(verbose_name=_("Date"))
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name="wins")
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.CASCADE, related_name="daily_wins"
+    )
+    points_total = models.IntegerField()
+    voter_count = models.IntegerField()
+
+    objects = DailyWinnerManager()
+
+    class Meta:
+        ordering = ["date", "menu"]
+        constraints = [
+            models.UniqueConstraint(fields=["date", "menu"], name="unique_daily_winner")
+        ]
+
+    def __str__(self):
+        return f"Menu {self.menu_id} won on {self.date}"
+
+
+class IdempotentResponse(models.Model):
+    """
+    The first response given to a vote request sent with an Idempotency-Key
+    header, replayed when the client retries the request with the same key.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotent_responses",
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            )
+        ]
+
+    def __str__(self):
+        return f"Response to {self.key} for User {self.user_id}"
@@ -0,0 +1,217 @@
+from datetime import date
+
+import numpy as np
+from django.db import connection
+from django.db.models import F, Sum
+
+from restaurants.models import Restaurant
+
+from .models import Vote
+
+METHODS = ("raw", "borda", "approval", "average_rank")
+
+# Rows fetched from the database at a time
+FETCH_SIZE = 10_000
+
+
+def ballot_entries(date_from, date_to):
+    # One row per restaurant on each ballot cast from date_from to date_to,
+    # with the points the ballot gives to the restaurant's menus
+    return (
+        Vote.objects.filter(voted_date__range=(date_from, date_to))
+        .values("employee_id", "voted_date", restaurant=F("menu__restaurant_id"))
+        .annotate(points=Sum("points"))
+        .order_by()
+        .values_list("employee_id", "voted_date", "restaurant", "points")
+    )
+
+
+def load_ballots(date_from, date_to):
+    """
+    Load the ballots cast from ``date_from`` to ``date_to`` with one query.
+    A ballot is everything one employee voted for on one day; the points a
+    ballot gives to the menus of one restaurant are summed by the database.
+
+    Returns arrays of ballot keys, restaurant ids and points, one entry per
+    restaurant on each ballot.
+    """
+    sql, params = ballot_entries(date_from, date_to).query.sql_with_params()
+
+    # The rows are streamed from the cursor in chunks and turned into arrays
+    # a column at a time, without building model values for every row
+    chunks = []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            employees, days, restaurants, points = zip(*rows)
+            chunks.append(
+                (
+                    np.array(employees, dtype=np.int64),
+                    np.fromiter(
+                        map(date.toordinal, days), dtype=np.int64, count=len(days)
+                    ),
+                    np.array(restaurants, dtype=np.int64),
+                    np.array(points, dtype=np.int64),
+                )
+            )
+    if not chunks:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    employees, days, restaurants, points = (
+        np.concatenate(column) for column in zip(*chunks)
+    )
+
+    # Dates become day numbers from the start of the range
+    first_day = date_from.toordinal()
+    span = date_to.toordinal() - first_day + 1
+    return employees * span + (days - first_day), restaurants, points
+
+
+def load_totals(date_from, date_to):
+    """
+    Return arrays of restaurant ids, summed points and ballot counts for the
+    ballots cast from ``date_from`` to ``date_to``. The ballot entries are
+    aggregated by the database, so only one row per restaurant is read.
+    """
+    sql, params = ballot_entries(date_from, date_to).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT entries.restaurant, SUM(entries.points), COUNT(*) "
+            f"FROM ({sql}) entries GROUP BY entries.restaurant",
+            params,
+        )
+        rows = cursor.fetchall()
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.array(column, dtype=np.int64) for column in zip(*rows))
+
+
+def ballot_ranks(ballots, points):
+    """
+    Return the 0-based rank of every entry within its ballot by descending
+    points, tied entries sharing the best rank, and the size of its ballot.
+    Needs a single sort.
+    """
+    # Sort by ballot, then by descending points
+    top = points.max() + 1
+    order = np.argsort(ballots * top + (top - 1 - points))
+    sorted_ballots = ballots[order]
+    sorted_points = points[order]
+    positions = np.arange(len(order))
+
+    new_ballot = np.ones(len(order), dtype=bool)
+    new_ballot[1:] = sorted_ballots[1:] != sorted_ballots[:-1]
+    new_tie = new_ballot.copy()
+    new_tie[1:] |= sorted_points[1:] != sorted_points[:-1]
+
+    # Running maxima give the start of each entry's ballot and tie group
+    ballot_starts = np.maximum.accumulate(np.where(new_ballot, positions, 0))
+    tie_starts = np.maximum.accumulate(np.where(new_tie, positions, 0))
+    ballot_ids = np.cumsum(new_ballot) - 1
+
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = tie_starts - ballot_starts
+    ballot_sizes = np.empty(len(order), dtype=np.int64)
+    ballot_sizes[order] = np.bincount(ballot_ids)[ballot_ids]
+    return ranks, ballot_sizes
+
+
+def order_standings(restaurant_ids, scores, ballot_counts, method):
+    # Best first: lowest average rank, highest score otherwise; ties by id
+    keys = scores if method == "average_rank" else -scores
+    order = np.lexsort((restaurant_ids, keys))
+    return restaurant_ids[order], scores[order], ballot_counts[order]
+
+
+def score_totals(restaurant_ids, points, ballot_counts, method):
+    """
+    Score restaurants with the "raw" or "approval" ``method`` from their
+    summed points and ballot counts. Returns ``(restaurant ids, scores,
+    ballot counts)`` arrays, best first.
+    """
+    if method not in ("raw", "approval"):
+        raise ValueError(f"Method {method!r} needs the ballots")
+    scores = (points if method == "raw" else ballot_counts).astype(float)
+    return order_standings(restaurant_ids, scores, ballot_counts, method)
+
+
+def rank_restaurants(ballots, restaurants, points, method):
+    """
+    Score every restaurant voted for with ``method``. ``ballots``,
+    ``restaurants`` and ``points`` hold one entry per restaurant on each
+    ballot. Returns ``(restaurant ids, scores, ballot counts)`` arrays, best
+    first.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown ranking method {method!r}")
+    if not len(ballots):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.astype(float), empty
+
+    # Number the restaurants densely without sorting
+    present = np.bincount(restaurants) > 0
+    restaurant_ids = np.flatnonzero(present)
+    index = (np.cumsum(present) - 1)[restaurants]
+    count = len(restaurant_ids)
+
+    ballot_counts = np.bincount(index, minlength=count)
+    if method == "raw":
+        scores = np.bincount(index, weights=points, minlength=count)
+    elif method == "approval":
+        scores = ballot_counts.astype(float)
+    else:
+        ranks, sizes = ballot_ranks(ballots, points)
+        if method == "borda":
+            # n - 1 points for the first of n candidates down to 0 for the last
+            scores = np.bincount(index, weights=sizes - 1 - ranks, minlength=count)
+        else:
+            scores = np.bincount(index, weights=ranks + 1, minlength=count)
+            scores /= ballot_counts
+
+    return order_standings(restaurant_ids, scores, ballot_counts, method)
+
+
+def get_standings(date_from, date_to, method):
+    """
+    Return the standings of the restaurants over a range of days scored with
+    ``method``.
+    """
+    if method in ("raw", "approval"):
+        # These only need each restaurant's totals, which the database sums
+        restaurant_ids, scores, ballot_counts = score_totals(
+            *load_totals(date_from, date_to), method
+        )
+    else:
+        ballots, restaurants, points = load_ballots(date_from, date_to)
+        restaurant_ids, scores, ballot_counts = rank_restaurants(
+            ballots, restaurants, points, method
+        )
+
+    names = dict(
+        Restaurant.objects.filter(id__in=restaurant_ids.tolist()).values_list(
+            "id", "name"
+        )
+    )
+    # Restaurants with the same score share the best rank of the group
+    standings = []
+    for position, (restaurant_id, score, ballot_count) in enumerate(
+        zip(restaurant_ids.tolist(), scores.tolist(), ballot_counts.tolist()),
+        start=1,
+    ):
+        score = round(score, 4)
+        if not standings or score != standings[-1]["score"]:
+            rank = position
+        standings.append(
+            {
+                "rank": rank,
+                "restaurant_id": restaurant_id,
+                "restaurant": names.get(restaurant_id),
+                "score": score,
+                "ballots": ballot_count,
+            }
+        )
+    return standings
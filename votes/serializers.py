@@ -2,6 +2,8 @@ from rest_framework import serializers
 
 from restaurants.models import Menu
 
+from .models import DailyWinner
+
 
 class VoteSerializer(serializers.Serializer):
     """
@@ -13,3 +15,9 @@ class VoteSerializer(serializers.Serializer):
 
     points = serializers.IntegerField(min_value=1, max_value=3)
     # The points field represents the number of points assigned to the menu vote
+
+
+class DailyWinnerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyWinner
+        fields = ["date", "menu", "restaurant", "points_total", "voter_count"]
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from restaurant_voting_app.versions import invalidate_leaderboard
+from restaurants.models import Menu
+
+
+@receiver([post_save, post_delete], sender=Menu)
+def invalidate_menu_leaderboard(sender, instance, **kwargs):
+    # A new or removed menu changes the standings for its day
+    invalidate_leaderboard(instance.menu_date)
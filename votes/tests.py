@@ -1,21 +1,39 @@
-from datetime import date
+import io
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
 from restaurants.models import Menu, Restaurant
 from restaurants.serializers import MenuSerializer
+from user_profiles.authentication import CachedTokenAuthentication, token_users
 from user_profiles.models import Employee, Organization, Role, UserProfile
 
-from .models import Vote
+from . import idempotency
+from .ballots import DuplicateVoteError, NotAnEmployeeError, record_ballot, record_vote
+from .checks import check_shared_cache
+from .leaderboard import compute_leaderboard, leaderboard_cache_stats
+from .management.commands.import_votes import Command as ImportVotesCommand
+from .models import DailyMenuTally, DailyWinner, IdempotentResponse, Vote
 
 
 class VoteMenuAPIViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         # Create test data
         self.user = UserProfile.objects.create(username="tester@example.com")
         self.restaurant = Restaurant.objects.create(name="Test Restaurant")
@@ -33,6 +51,9 @@ class VoteMenuAPIViewTests(TestCase):
         self.token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
 
+    def vote_total(self, menu):
+        return Menu.objects.with_vote_totals().get(id=menu.id).vote_total
+
     def test_vote_single_menu(self):
         url = reverse("vote-menu")
         headers = {"HTTP_BUILD_VERSION": "old"}  # Add the build_version header
@@ -53,8 +74,139 @@ class VoteMenuAPIViewTests(TestCase):
                 menu=self.menu, employee_id=self.employee.id, voted_date=date.today()
             ).exists()
         )
-        self.menu.refresh_from_db()
-        self.assertEqual(self.menu.votes, 1)
+        self.assertEqual(self.vote_total(self.menu), 1)
+
+    def test_vote_single_menu_twice(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "old"}
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+
+        self.client.post(url, data, format="json", **headers)
+        response = self.client.post(url, data, format="json", **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {"error": "You have already voted for this menu today"}
+        )
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(self.vote_total(self.menu), 1)
+
+    def test_vote_replayed_with_idempotency_key(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "old", "HTTP_IDEMPOTENCY_KEY": "retry-1"}
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+
+        first = self.client.post(url, data, format="json", **headers)
+        # The replay reads the stored response and nothing else
+        with self.assertNumQueries(1):
+            retry = self.client.post(url, data, format="json", **headers)
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(self.vote_total(self.menu), 1)
+
+        # The key cannot be reused for another request
+        other = Menu.objects.create(restaurant=self.restaurant)
+        data = {"menu_id": other.id, "employee_id": self.employee.id}
+        response = self.client.post(url, data, format="json", **headers)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_concurrent_idempotency_key_gets_the_first_response(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "old", "HTTP_IDEMPOTENCY_KEY": "retry-1"}
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+        first = self.client.post(url, data, format="json", **headers)
+
+        # The second request looked the key up before the first one committed
+        lookups = [None]
+        find_response = idempotency.find_response
+
+        def racing_find_response(user, key):
+            return lookups.pop() if lookups else find_response(user, key)
+
+        with mock.patch.object(idempotency, "find_response", racing_find_response):
+            retry = self.client.post(url, data, format="json", **headers)
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_expired_idempotency_key_is_reused(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "old", "HTTP_IDEMPOTENCY_KEY": "retry-1"}
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+
+        self.client.post(url, data, format="json", **headers)
+        IdempotentResponse.objects.update(
+            created_at=timezone.now()
+            - timedelta(seconds=settings.VOTE_IDEMPOTENCY_TTL + 1)
+        )
+        response = self.client.post(url, data, format="json", **headers)
+
+        # The request runs again and is rejected as a duplicate vote, which is
+        # not stored so that a retry runs again too
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertFalse(IdempotentResponse.objects.exists())
+
+    def test_purge_idempotency_keys(self):
+        url = reverse("vote-menu")
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+        self.client.post(
+            url,
+            data,
+            format="json",
+            HTTP_BUILD_VERSION="old",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+        IdempotentResponse.objects.update(
+            created_at=timezone.now()
+            - timedelta(seconds=settings.VOTE_IDEMPOTENCY_TTL + 1)
+        )
+
+        call_command("purge_idempotency_keys", stdout=io.StringIO())
+        self.assertFalse(IdempotentResponse.objects.exists())
+
+    @override_settings(VOTE_THROTTLE_RATES={"old": "2/min", "new": "5/min"})
+    def test_vote_throttled_per_build_version(self):
+        url = reverse("vote-menu")
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+
+        for _ in range(2):
+            self.client.post(url, data, format="json", HTTP_BUILD_VERSION="old")
+        # A throttled request never reaches the database
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                url, data, format="json", HTTP_BUILD_VERSION="old"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # The two requests slide out of the window within 90 seconds
+        self.assertTrue(0 < int(response["Retry-After"]) <= 90)
+
+        # New build clients have their own limit
+        response = self.client.post(url, {}, format="json", HTTP_BUILD_VERSION="new")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(VOTE_THROTTLE_RATES={"old": "0/min"})
+    def test_vote_blocked_by_zero_rate(self):
+        url = reverse("vote-menu")
+        data = {"menu_id": self.menu.id, "employee_id": self.employee.id}
+
+        response = self.client.post(url, data, format="json", HTTP_BUILD_VERSION="old")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotIn("Retry-After", response)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_duplicate_vote_rejected_by_database(self):
+        Vote.objects.create(menu=self.menu, employee=self.employee)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(menu=self.menu, employee=self.employee)
 
     def test_vote_multiple_menus(self):
         url = reverse("vote-menu")
@@ -83,8 +235,70 @@ class VoteMenuAPIViewTests(TestCase):
                 menu=menu1.id, employee_id=self.employee.id, voted_date=date.today()
             ).exists()
         )
-        menu1.refresh_from_db()
-        self.assertEqual(menu1.votes, 6)
+        self.assertEqual(self.vote_total(menu1), 6)
+
+        # The points are kept on the votes and in the day's tallies
+        self.assertEqual(Vote.objects.get(menu=menu3).points, 3)
+        tally = DailyMenuTally.objects.get(menu=menu2)
+        self.assertEqual((tally.points_total, tally.voter_count), (2, 1))
+
+    def test_vote_multiple_menus_is_atomic(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "new"}
+        menu1 = Menu.objects.create(restaurant=self.restaurant, votes=0)
+        menu2 = Menu.objects.create(restaurant=self.restaurant, votes=0)
+        Vote.objects.create(menu=self.menu, employee=self.employee)
+
+        data = {
+            "votes": [
+                {"menu_id": menu1.id, "points": 3},
+                {"menu_id": menu2.id, "points": 2},
+                {"menu_id": self.menu.id, "points": 1},  # Already voted today
+            ],
+            "employee_id": self.employee.id,
+        }
+
+        response = self.client.post(url, data, format="json", **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {"error": "You have already voted for this menu today"}
+        )
+
+        # No part of the rejected ballot is recorded
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(self.vote_total(menu1), 0)
+        self.assertEqual(self.vote_total(menu2), 0)
+
+    def test_vote_multiple_menus_query_count(self):
+        menus = [Menu.objects.create(restaurant=self.restaurant) for _ in range(5)]
+
+        # The number of queries does not grow with the size of the ballot
+        with self.assertNumQueries(7):
+            record_ballot(self.employee.id, {menus[0].id: 3})
+        with self.assertNumQueries(7):
+            record_ballot(self.employee.id, {menu.id: 1 for menu in menus[1:]})
+
+        self.assertEqual(Vote.objects.count(), 5)
+
+    def test_vote_multiple_menus_invalid_points(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "new"}
+
+        data = {
+            "votes": [
+                {"menu_id": self.menu.id, "points": 4},
+                {"menu_id": self.menu.id, "points": 2},
+                {"menu_id": self.menu.id, "points": 1},
+            ],
+            "employee_id": self.employee.id,
+        }
+
+        response = self.client.post(url, data, format="json", **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {"error": "Invalid vote data"})
+        self.assertFalse(Vote.objects.exists())
 
     def test_vote_invalid_menu_id(self):
         url = reverse("vote-menu")
@@ -100,25 +314,62 @@ class VoteMenuAPIViewTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data, {"error": "Invalid menu ID"})
 
-    def test_vote_invalid_employee_id(self):
+    def test_vote_as_non_employee(self):
         url = reverse("vote-menu")
         headers = {"HTTP_BUILD_VERSION": "old"}  # Add the build_version header
 
+        # A user without an employee cannot vote, whatever the body says
+        user = UserProfile.objects.create(username="guest", email="guest@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Token " + Token.objects.create(user=user).key
+        )
         data = {
             "menu_id": self.menu.id,
-            "employee_id": 999,  # Invalid employee ID
+            "employee_id": self.employee.id,
         }
 
         response = self.client.post(url, data, format="json", **headers)
 
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertEqual(response.data, {"error": "Provide a valid employee ID"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data, {"error": "Only employees can vote"})
+        self.assertFalse(Vote.objects.exists())
+
+    def test_vote_as_authenticated_employee(self):
+        url = reverse("vote-menu")
+        headers = {"HTTP_BUILD_VERSION": "old"}
+        other = Employee.objects.create(
+            employee_id="other",
+            user=UserProfile.objects.create(username="other", email="o@example.com"),
+            organization_id=self.organization.id,
+            role_id=self.role.id,
+        )
+
+        # The employee ID in the body is ignored
+        response = self.client.post(
+            url,
+            {"menu_id": self.menu.id, "employee_id": other.id},
+            format="json",
+            **headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Vote.objects.get().employee_id, self.employee.id)
+
+        # Removing the employee is seen by the next request
+        self.employee.delete()
+        response = self.client.post(
+            url, {"menu_id": self.menu.id}, format="json", **headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_vote_results_for_current_day(self):
         # Create multiple menus for the current day
         menu1 = Menu.objects.create(restaurant=self.restaurant, votes=5)
         menu2 = Menu.objects.create(restaurant=self.restaurant, votes=3)
         menu3 = Menu.objects.create(restaurant=self.restaurant, votes=5)
+        for menu in [menu1, menu2, menu3]:
+            DailyMenuTally.objects.create(
+                menu=menu, date=menu.menu_date, points_total=menu.votes
+            )
 
         url = reverse("winning-menu")
 
@@ -128,3 +379,780 @@ class VoteMenuAPIViewTests(TestCase):
 
         expected_data = MenuSerializer([menu1, menu3], many=True).data
         self.assertEqual(response.data, expected_data)
+
+    def test_vote_results_cached_until_next_vote(self):
+        url = reverse("winning-menu")
+        menu2 = Menu.objects.create(restaurant=self.restaurant)
+
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data), 2)
+
+        # The token is resolved from the cache too
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        # A committed vote moves the leaderboard to a new version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("vote-menu"),
+                {"menu_id": menu2.id, "employee_id": self.employee.id},
+                format="json",
+                HTTP_BUILD_VERSION="old",
+            )
+
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual([menu["id"] for menu in response.data], [menu2.id])
+        self.assertEqual(leaderboard_cache_stats()["hits"], 1)
+        self.assertEqual(leaderboard_cache_stats()["misses"], 2)
+
+    @override_settings(DAY_ETAGS=True)
+    def test_vote_results_not_modified(self):
+        url = reverse("winning-menu")
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A committed vote changes the validator
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("vote-menu"),
+                {"menu_id": self.menu.id, "employee_id": self.employee.id},
+                format="json",
+                HTTP_BUILD_VERSION="old",
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(DAY_ETAGS=False)
+    def test_vote_results_without_shared_versions_have_no_etag(self):
+        response = self.client.get(reverse("winning-menu"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ["votes.E001"]
+        )
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class RecordVoteIntegrityTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        token_users.clear_local()
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name="Test Restaurant")
+        )
+        self.employee = Employee.objects.create(
+            user=UserProfile.objects.create(username="tester@example.com"),
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+
+    def test_only_duplicate_votes_are_reported_as_duplicates(self):
+        record_vote(self.menu, self.employee.id)
+        with self.assertRaises(DuplicateVoteError):
+            record_vote(self.menu, self.employee.id)
+
+        # A missing employee is an error of its own, and a missing menu is
+        # not a ballot error at all
+        with self.assertRaises(NotAnEmployeeError):
+            record_vote(self.menu, self.employee.id + 1)
+        with self.assertRaises(IntegrityError):
+            record_vote(Menu(id=self.menu.id + 1), self.employee.id)
+
+    def test_vote_of_a_removed_employee_is_forbidden(self):
+        token = Token.objects.create(user=self.employee.user)
+        user, _ = CachedTokenAuthentication().authenticate_credentials(token.key)
+
+        # Another process still has the employee cached for the token
+        self.employee.delete()
+        token_users.set(token.key, user)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        response = client.post(
+            reverse("vote-menu"),
+            {"menu_id": self.menu.id},
+            format="json",
+            HTTP_BUILD_VERSION="old",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data, {"error": "Only employees can vote"})
+        self.assertIsNone(token_users.get(token.key))
+
+
+class DailyMenuTallyTests(TestCase):
+    def setUp(self):
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name="Test Restaurant"),
+            menu_date=date(2023, 5, 1),
+        )
+        self.employee = Employee.objects.create(
+            user=UserProfile.objects.create(username="tester@example.com"),
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+
+    def test_votes_are_tallied_on_the_day_they_are_cast(self):
+        record_vote(self.menu, self.employee.id, voted_date=date(2023, 5, 1))
+        record_ballot(self.employee.id, {self.menu.id: 3}, voted_date=date(2023, 5, 2))
+
+        self.assertEqual(
+            list(
+                DailyMenuTally.objects.filter(menu=self.menu)
+                .order_by("date")
+                .values_list("date", "points_total", "voter_count")
+            ),
+            [(date(2023, 5, 1), 1, 1), (date(2023, 5, 2), 3, 1)],
+        )
+
+    def test_tallies_are_summed_over_shards(self):
+        for shard, points in enumerate([3, 2]):
+            DailyMenuTally.objects.create(
+                menu=self.menu,
+                date=date(2023, 5, 1),
+                shard=shard,
+                points_total=points,
+                voter_count=1,
+            )
+
+        self.assertEqual(
+            list(DailyMenuTally.objects.totals()),
+            [
+                {
+                    "menu_id": self.menu.id,
+                    "date": date(2023, 5, 1),
+                    "points": 5,
+                    "voters": 2,
+                }
+            ],
+        )
+        self.assertEqual(compute_leaderboard(date(2023, 5, 1))[0]["votes"], 5)
+
+
+class AsyncVoteMenuAPIViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserProfile.objects.create(username="tester@example.com")
+        self.restaurant = Restaurant.objects.create(name="Test Restaurant")
+        self.menu = Menu.objects.create(restaurant=self.restaurant)
+        self.employee = Employee.objects.create(
+            employee_id="tester",
+            user=self.user,
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+
+    async def test_vote_single_menu(self):
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            {"menu_id": self.menu.id, "employee_id": self.employee.id},
+            content_type="application/json",
+            headers={**self.headers, "Build-Version": "old"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"message": "Vote recorded successfully"})
+        self.assertTrue(await Vote.objects.filter(menu=self.menu).aexists())
+
+    async def test_vote_replayed_with_idempotency_key(self):
+        headers = {**self.headers, "Build-Version": "old", "Idempotency-Key": "k1"}
+        data = {"menu_id": self.menu.id}
+
+        first = await self.async_client.post(
+            reverse("vote-menu-async"),
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+        retry = await self.async_client.post(
+            reverse("vote-menu-async"),
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(await Vote.objects.acount(), 1)
+
+        # Rejected requests are not stored, so a corrected retry runs
+        headers["Idempotency-Key"] = "k2"
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            {"menu_id": 0},
+            content_type="application/json",
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(await IdempotentResponse.objects.filter(key="k2").aexists())
+
+    @override_settings(VOTE_THROTTLE_RATES={"old": "1/min"})
+    async def test_vote_throttled(self):
+        for expected in (status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS):
+            response = await self.async_client.post(
+                reverse("vote-menu-async"),
+                {"menu_id": self.menu.id},
+                content_type="application/json",
+                headers={**self.headers, "Build-Version": "old"},
+            )
+            self.assertEqual(response.status_code, expected)
+        self.assertTrue(0 < int(response["Retry-After"]) <= 120)
+
+    async def test_vote_multiple_menus_already_voted(self):
+        menus = [
+            await Menu.objects.acreate(restaurant=self.restaurant) for _ in range(2)
+        ]
+        await Vote.objects.acreate(menu=self.menu, employee=self.employee)
+        data = {
+            "votes": [
+                {"menu_id": menus[0].id, "points": 3},
+                {"menu_id": menus[1].id, "points": 2},
+                {"menu_id": self.menu.id, "points": 1},
+            ],
+            "employee_id": self.employee.id,
+        }
+
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            data,
+            content_type="application/json",
+            headers={**self.headers, "Build-Version": "new"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"error": "You have already voted for this menu today"}
+        )
+        self.assertEqual(await Vote.objects.acount(), 1)
+
+    async def test_vote_requires_authentication(self):
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            {"menu_id": self.menu.id, "employee_id": self.employee.id},
+            content_type="application/json",
+            headers={"Build-Version": "old"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # The challenge is the one of the sync view
+        sync_response = await sync_to_async(self.client.post)(
+            reverse("vote-menu"), {"menu_id": self.menu.id}
+        )
+        self.assertEqual(sync_response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            response["WWW-Authenticate"], sync_response["WWW-Authenticate"]
+        )
+
+    async def test_vote_single_menu_with_form_data(self):
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            {"menu_id": self.menu.id},
+            headers={**self.headers, "Build-Version": "old"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await Vote.objects.filter(menu=self.menu).aexists())
+
+    async def test_vote_with_malformed_json(self):
+        response = await self.async_client.post(
+            reverse("vote-menu-async"),
+            "{",
+            content_type="application/json",
+            headers={**self.headers, "Build-Version": "old"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("JSON parse error", response.json()["detail"])
+
+    @override_settings(DAY_ETAGS=True)
+    async def test_vote_results_for_current_day(self):
+        menu2 = await Menu.objects.acreate(restaurant=self.restaurant)
+        await DailyMenuTally.objects.acreate(
+            menu=self.menu, date=self.menu.menu_date, points_total=4
+        )
+        await DailyMenuTally.objects.acreate(
+            menu=menu2, date=menu2.menu_date, points_total=2
+        )
+
+        response = await self.async_client.get(
+            reverse("winning-menu-async"), headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([menu["id"] for menu in response.json()], [self.menu.id])
+
+        # Polling with the returned ETag gets a 304
+        response = await self.async_client.get(
+            reverse("winning-menu-async"),
+            headers={**self.headers, "If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class VoteStandingsAPIViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        organization = Organization.objects.create(name="Test org")
+        role = Role.objects.create(name="Test role")
+        self.employees = [
+            Employee.objects.create(
+                user=UserProfile.objects.create(
+                    username=f"voter{index}", email=f"voter{index}@example.com"
+                ),
+                organization=organization,
+                role=role,
+            )
+            for index in range(3)
+        ]
+        self.client.force_authenticate(self.employees[0].user)
+
+        self.restaurants = [
+            Restaurant.objects.create(name=name) for name in ("Alpha", "Beta", "Gamma")
+        ]
+        self.day = date(2023, 5, 1)
+        menus = [
+            Menu.objects.create(restaurant=restaurant, menu_date=self.day)
+            for restaurant in self.restaurants
+        ]
+        ballots = [
+            # New build ballots rank three menus, old build votes give one point
+            (self.employees[0], [(menus[0], 3), (menus[1], 2), (menus[2], 1)]),
+            (self.employees[1], [(menus[1], 3), (menus[2], 2), (menus[0], 1)]),
+            (self.employees[2], [(menus[0], 1)]),
+        ]
+        Vote.objects.bulk_create(
+            Vote(menu=menu, employee=employee, points=points, voted_date=self.day)
+            for employee, votes in ballots
+            for menu, points in votes
+        )
+
+    def standings(self, method):
+        response = self.client.get(
+            reverse("vote-standings"),
+            {"from": "2023-04-25", "to": "2023-05-01", "method": method},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            (standing["restaurant"], standing["score"], standing["ballots"])
+            for standing in response.data["results"]
+        ]
+
+    def test_standings_by_method(self):
+        self.assertEqual(
+            self.standings("raw"), [("Alpha", 5, 3), ("Beta", 5, 2), ("Gamma", 3, 2)]
+        )
+        self.assertEqual(
+            self.standings("borda"), [("Beta", 3, 2), ("Alpha", 2, 3), ("Gamma", 1, 2)]
+        )
+        self.assertEqual(
+            self.standings("approval"),
+            [("Alpha", 3, 3), ("Beta", 2, 2), ("Gamma", 2, 2)],
+        )
+        self.assertEqual(
+            self.standings("average_rank"),
+            [("Beta", 1.5, 2), ("Alpha", 1.6667, 3), ("Gamma", 2.5, 2)],
+        )
+
+    def test_tied_standings_share_a_rank(self):
+        response = self.client.get(
+            reverse("vote-standings"),
+            {"from": "2023-04-25", "to": "2023-05-01", "method": "raw"},
+        )
+        self.assertEqual(
+            [standing["rank"] for standing in response.data["results"]], [1, 1, 3]
+        )
+
+    def test_standings_outside_range(self):
+        response = self.client.get(
+            reverse("vote-standings"), {"from": "2023-05-02", "to": "2023-05-31"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_standings_invalid_parameters(self):
+        url = reverse("vote-standings")
+        for params in (
+            {"from": "yesterday"},
+            {"from": "2023-05-02", "to": "2023-05-01"},
+            {"from": "2020-01-01", "to": "2023-05-01"},
+            {"method": "condorcet"},
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DailyWinnerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            UserProfile.objects.create(username="tester@example.com")
+        )
+        self.restaurant = Restaurant.objects.create(name="Test Restaurant")
+        self.days = [date(2023, 5, day) for day in (1, 2, 3)]
+        self.menus = {}
+        for day, points in zip(self.days, ([5, 3], [4, 4], [1, 2])):
+            for menu_points in points:
+                menu = Menu.objects.create(restaurant=self.restaurant, menu_date=day)
+                DailyMenuTally.objects.create(
+                    menu=menu, date=day, points_total=menu_points, voter_count=1
+                )
+                self.menus.setdefault(day, []).append(menu)
+
+    def test_record_daily_winners_backfill(self):
+        out = io.StringIO()
+        call_command("record_daily_winners", "--backfill", stdout=out)
+        self.assertIn("Recorded 4 winners", out.getvalue())
+
+        # Tied menus both win their day
+        self.assertEqual(
+            list(DailyWinner.objects.values_list("date", "menu", "points_total")),
+            [
+                (self.days[0], self.menus[self.days[0]][0].id, 5),
+                (self.days[1], self.menus[self.days[1]][0].id, 4),
+                (self.days[1], self.menus[self.days[1]][1].id, 4),
+                (self.days[2], self.menus[self.days[2]][1].id, 2),
+            ],
+        )
+
+        # Recording a day again replaces its winners
+        DailyMenuTally.objects.create(
+            menu=self.menus[self.days[2]][0],
+            date=self.days[2],
+            shard=1,
+            points_total=8,
+            voter_count=1,
+        )
+        call_command(
+            "record_daily_winners",
+            "--from",
+            "2023-05-03",
+            "--to",
+            "2023-05-03",
+            stdout=io.StringIO(),
+        )
+        winner = DailyWinner.objects.get(date=self.days[2])
+        self.assertEqual(winner.menu, self.menus[self.days[2]][0])
+
+    def test_only_menus_of_the_day_win_it(self):
+        # Votes imported for a menu after its day do not win the later day
+        DailyMenuTally.objects.create(
+            menu=self.menus[self.days[0]][0],
+            date=date(2023, 5, 4),
+            points_total=9,
+            voter_count=1,
+        )
+
+        out = io.StringIO()
+        call_command(
+            "record_daily_winners",
+            "--from",
+            "2023-05-03",
+            "--to",
+            "2023-05-04",
+            stdout=out,
+        )
+
+        self.assertIn("No winner on 2023-05-04", out.getvalue())
+        self.assertIn("Recorded 1 winners", out.getvalue())
+        self.assertEqual(
+            list(DailyWinner.objects.values_list("date", flat=True)), [self.days[2]]
+        )
+
+    def test_record_daily_winners_rejects_open_day(self):
+        with self.assertRaises(CommandError):
+            call_command("record_daily_winners", "--to", date.today().isoformat())
+
+    def test_daily_winners_range(self):
+        DailyWinner.objects.record(self.days[0], self.days[-1])
+        url = reverse("daily-winners")
+
+        response = self.client.get(
+            url, {"from": "2023-05-02", "to": "2023-05-03", "page_size": 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(
+            [winner["date"] for winner in response.data["results"]],
+            ["2023-05-02", "2023-05-02"],
+        )
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(url, {"from": "May 2nd"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportVotesCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserProfile.objects.create(username="tester@example.com")
+        self.restaurant = Restaurant.objects.create(name="Test Restaurant")
+        self.menu1 = Menu.objects.create(restaurant=self.restaurant)
+        self.menu2 = Menu.objects.create(restaurant=self.restaurant)
+        self.menu3 = Menu.objects.create(restaurant=self.restaurant)
+        self.employee = Employee.objects.create(
+            employee_id="tester",
+            user=self.user,
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+
+    def import_votes(self, content, suffix):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as source:
+            source.write(content)
+        self.addCleanup(os.remove, source.name)
+        stdout = io.StringIO()
+        call_command("import_votes", source.name, chunk_size=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def ballot(self, voted_date, *votes):
+        # NDJSON lines for one ballot of (menu_id, points) pairs
+        return [
+            json.dumps(
+                {
+                    "employee_id": self.employee.id,
+                    "menu_id": menu_id,
+                    "points": points,
+                    "voted_date": voted_date,
+                }
+            )
+            for menu_id, points in votes
+        ]
+
+    def test_import_ndjson(self):
+        menus = (self.menu1.id, self.menu2.id, self.menu3.id)
+        unknown_menu = (self.menu1.id, 999, self.menu2.id)
+        lines = [
+            *self.ballot("2023-05-11", *zip(menus, (3, 2, 1))),
+            *self.ballot("2023-05-12", *zip(unknown_menu, (3, 2, 1))),
+            *self.ballot("2023-05-13", (self.menu1.id, 3)),
+            "not json",
+            *self.ballot("2023-05-11", *zip(menus, (1, 2, 3))),
+        ]
+
+        output = self.import_votes("\n".join(lines) + "\n", ".ndjson")
+
+        self.assertIn("Imported 3 votes, rejected 8 rows", output)
+        self.assertIn("3 rejected: Already voted for this menu that day", output)
+        self.assertIn("3 rejected: Invalid menu ID", output)
+        self.assertIn("2 rejected: Invalid vote data", output)
+        self.assertEqual(
+            Menu.objects.with_vote_totals().get(id=self.menu1.id).vote_total, 3
+        )
+        self.assertTrue(
+            Vote.objects.filter(
+                menu=self.menu2, points=2, voted_date=date(2023, 5, 11)
+            ).exists()
+        )
+
+    def test_import_csv(self):
+        rows = [
+            (self.menu1.id, 3, "2023-05-11"),
+            (self.menu2.id, 2, "2023-05-11"),
+            (self.menu3.id, 1, "2023-05-11"),
+            (self.menu1.id, 3, "not-a-date"),
+            (self.menu2.id, 2, "not-a-date"),
+            (self.menu3.id, 1, "not-a-date"),
+        ]
+        content = "employee_id,menu_id,points,voted_date\n" + "".join(
+            f"{self.employee.id},{menu_id},{points},{voted_date}\n"
+            for menu_id, points, voted_date in rows
+        )
+
+        output = self.import_votes(content, ".csv")
+
+        self.assertIn("Imported 3 votes, rejected 3 rows", output)
+        self.assertIn("3 rejected: Invalid voted date", output)
+        self.assertEqual(
+            Menu.objects.with_vote_totals().get(id=self.menu1.id).vote_total, 3
+        )
+
+    def test_import_conflict_rejects_only_conflicting_ballots(self):
+        # A vote written after the chunk was checked conflicts with one ballot
+        Vote.objects.create(
+            menu=self.menu1,
+            employee=self.employee,
+            points=1,
+            voted_date=date(2023, 5, 11),
+        )
+        menus = (self.menu1.id, self.menu2.id, self.menu3.id)
+        lines = [
+            *self.ballot("2023-05-11", *zip(menus, (3, 2, 1))),
+            *self.ballot("2023-05-12", *zip(menus, (3, 2, 1))),
+        ]
+
+        with mock.patch.object(
+            ImportVotesCommand, "find_cast_votes", return_value=set()
+        ):
+            output = self.import_votes("\n".join(lines), ".ndjson")
+
+        self.assertIn("Imported 3 votes, rejected 3 rows", output)
+        self.assertIn("3 rejected: Already voted for this menu that day", output)
+        self.assertEqual(
+            Menu.objects.with_vote_totals().get(id=self.menu2.id).vote_total, 2
+        )
+
+    def test_import_missing_file(self):
+        with self.assertRaisesMessage(CommandError, "Cannot read"):
+            call_command("import_votes", "/nonexistent/votes.ndjson")
+
+
+class ReconcileVotesCommandTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username="tester@example.com")
+        self.restaurant = Restaurant.objects.create(name="Test Restaurant")
+        self.employee = Employee.objects.create(
+            employee_id="tester",
+            user=self.user,
+            organization=Organization.objects.create(name="Test org"),
+            role=Role.objects.create(name="Test role"),
+        )
+
+    def test_reconcile_votes(self):
+        drifted = Menu.objects.create(restaurant=self.restaurant, votes=5)
+        Vote.objects.create(menu=drifted, employee=self.employee, points=3)
+        in_sync = Menu.objects.create(restaurant=self.restaurant, votes=2)
+        Vote.objects.create(menu=in_sync, employee=self.employee, points=2)
+        DailyMenuTally.objects.create(
+            menu=in_sync, date=date.today(), points_total=1, voter_count=1
+        )
+        old = Menu.objects.create(
+            restaurant=self.restaurant, votes=4, menu_date=date(2023, 5, 11)
+        )
+
+        stdout = io.StringIO()
+        call_command(
+            "reconcile_votes",
+            "--since",
+            "2023-05-01",
+            "--from",
+            date.today().isoformat(),
+            batch_size=1,
+            stdout=stdout,
+        )
+
+        self.assertIn(
+            f"{drifted} ({drifted.menu_date}): counted 5, logged 3", stdout.getvalue()
+        )
+        self.assertIn(
+            "Fixed 1 drifted menus and 2 drifted daily tallies out of 2 menus "
+            "checked",
+            stdout.getvalue(),
+        )
+        drifted.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual(drifted.votes, 3)
+        self.assertEqual(old.votes, 4)
+        self.assertEqual(
+            sorted(
+                DailyMenuTally.objects.values_list(
+                    "menu", "date", "points_total", "voter_count"
+                )
+            ),
+            [
+                (drifted.id, date.today(), 3, 1),
+                (in_sync.id, date.today(), 2, 1),
+            ],
+        )
+
+    def test_reconcile_votes_skips_menus_with_legacy_votes(self):
+        # Votes cast before points were stored may have counted for more
+        menu = Menu.objects.create(restaurant=self.restaurant, votes=3)
+        Vote.objects.create(
+            menu=menu, employee=self.employee, voted_date=date(2023, 5, 11)
+        )
+
+        stdout = io.StringIO()
+        call_command("reconcile_votes", "--since", "2023-06-01", stdout=stdout)
+
+        self.assertIn("(1 with votes before 2023-06-01 skipped)", stdout.getvalue())
+        menu.refresh_from_db()
+        self.assertEqual(menu.votes, 3)
+
+    def test_reconcile_votes_checks_every_menu_without_since(self):
+        menu = Menu.objects.create(restaurant=self.restaurant, votes=3)
+        Vote.objects.create(
+            menu=menu, employee=self.employee, voted_date=date(2023, 5, 11)
+        )
+        other = Menu.objects.create(restaurant=self.restaurant)
+
+        stdout = io.StringIO()
+        # One query locks the batch, three read the votes, counters and
+        # tallies, and three write the fixes, within one savepoint
+        with self.assertNumQueries(9):
+            call_command("reconcile_votes", stdout=stdout)
+
+        self.assertIn(
+            "Fixed 1 drifted menus and 1 drifted daily tallies out of 2 menus "
+            "checked in",
+            stdout.getvalue(),
+        )
+        menu.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((menu.votes, other.votes), (1, 0))
+        self.assertEqual(
+            list(DailyMenuTally.objects.totals().values_list("points", "voters")),
+            [(1, 1)],
+        )
+
+
+class BenchVotesCommandTests(TransactionTestCase):
+    def test_bench_votes_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "bench.json")
+            call_command(
+                "bench_votes",
+                voters=6,
+                menus=3,
+                threads=2,
+                output=output,
+                stdout=io.StringIO(),
+            )
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(set(report["endpoints"]), {"vote-old", "vote-new", "results"})
+        self.assertEqual(report["endpoints"]["results"]["requests"], 6)
+        self.assertIn("p99", report["endpoints"]["vote-new"]["latency_ms"])
+        self.assertEqual(report["counters"]["lost_points"], 0)
+
+        # The seeded data is removed afterwards
+        self.assertFalse(Restaurant.objects.exists())
+        self.assertFalse(UserProfile.objects.exists())
+
+
+@override_settings(ALLOWED_HOSTS=["localhost"])
+class BenchStandingsCommandTests(TestCase):
+    def test_bench_standings_report(self):
+        stdout = io.StringIO()
+        call_command(
+            "bench_standings", voters=4, days=2, restaurants=3, repeat=1, stdout=stdout
+        )
+        report = json.loads(stdout.getvalue())
+
+        self.assertEqual(report["votes"], 24)
+        self.assertEqual(report["ballot_entries"], 24)
+        self.assertEqual(
+            set(report["methods"]), {"raw", "borda", "approval", "average_rank"}
+        )
+        self.assertEqual(report["methods"]["raw"]["queries"], 2)
+
+        # The seeded data is removed afterwards
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(Restaurant.objects.exists())
@@ -0,0 +1,120 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class VoteRateThrottle(BaseThrottle):
+    """
+    Sliding window limit per user for the vote endpoints, kept in the cache
+    so that rejected requests never reach the database.
+
+    Rates are set per build version in settings.VOTE_THROTTLE_RATES as
+    ``"<requests>/<s|min|hour|day>"``: each build version allows ``requests``
+    requests over any period of that length. A rate of None disables the
+    throttle, and a rate of 0 requests rejects every request.
+
+    Requests are counted per fixed window with the cache's atomic add() and
+    incr(), and the count of the previous window is weighted by how much of
+    it the sliding window still covers. A token bucket would need to read
+    and write its level and timestamp atomically, which Django's cache API
+    cannot do across processes, so it is approximated by this sliding window
+    instead: a client may still spend the whole limit at once, but never
+    more than the limit over any period.
+    """
+
+    cache_format = "throttle:vote:{scope}:{user}:{window}"
+
+    def get_scope(self, request):
+        # Each build version with its own rate has its own limit
+        build_version = request.META.get("HTTP_BUILD_VERSION")
+        if build_version in settings.VOTE_THROTTLE_RATES:
+            return build_version
+        return "default"
+
+    def parse_rate(self, rate):
+        # Same format as DRF's SimpleRateThrottle rates
+        num, period = rate.split("/")
+        duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+        return int(num), duration
+
+    def get_window(self, request):
+        """
+        Return ``(key, previous_key, limit, duration, elapsed)`` for the
+        request's current window, or None when the request is not throttled.
+        ``elapsed`` is the fraction of the current window that has passed.
+        """
+        scope = self.get_scope(request)
+        rate = settings.VOTE_THROTTLE_RATES.get(scope)
+        user = getattr(request, "user", None)
+        if rate is None or user is None or not user.is_authenticated:
+            return None
+
+        limit, duration = self.parse_rate(rate)
+        # Wall clock time, as the windows are shared by every process using
+        # the cache
+        window, offset = divmod(time.time(), duration)
+        key = self.cache_format.format(scope=scope, user=user.pk, window=int(window))
+        previous_key = self.cache_format.format(
+            scope=scope, user=user.pk, window=int(window) - 1
+        )
+        return key, previous_key, limit, duration, offset / duration
+
+    def check(self, count, previous_count, limit, duration, elapsed):
+        # Decide on a request that made ``count`` requests in the current window
+        if limit == 0:
+            # No request is ever allowed, so there is no time to retry at
+            self.retry_after = None
+            return False
+
+        estimate = count + previous_count * (1 - elapsed)
+        if estimate <= limit:
+            self.retry_after = None
+            return True
+
+        # Wait until the previous window has slid out enough to make room. When
+        # the current window alone is full, wait for it to slide out instead.
+        if count <= limit:
+            room_at = 1 - (limit - count) / previous_count
+        else:
+            room_at = 1 + max(1 - (limit - 1) / (count - 1), 0)
+        self.retry_after = (room_at - elapsed) * duration
+        return False
+
+    def allow_request(self, request, view):
+        window = self.get_window(request)
+        if window is None:
+            self.retry_after = None
+            return True
+        key, previous_key, limit, duration, elapsed = window
+
+        # A window is kept until the next one has passed too
+        cache.add(key, 0, timeout=2 * duration)
+        count = cache.incr(key)
+        if self.check(count, cache.get(previous_key, 0), limit, duration, elapsed):
+            return True
+        # Rejected requests do not count against the limit
+        cache.decr(key)
+        return False
+
+    async def aallow_request(self, request, view):
+        """
+        Async version of allow_request() for async views.
+        """
+        window = self.get_window(request)
+        if window is None:
+            self.retry_after = None
+            return True
+        key, previous_key, limit, duration, elapsed = window
+
+        await cache.aadd(key, 0, timeout=2 * duration)
+        count = await cache.aincr(key)
+        previous_count = await cache.aget(previous_key, 0)
+        if self.check(count, previous_count, limit, duration, elapsed):
+            return True
+        await cache.adecr(key)
+        return False
+
+    def wait(self):
+        return self.retry_after
@@ -1,6 +1,9 @@
 from django.urls import path
 
-from .views import VoteMenuAPIView, VoteResultsForCurrentDayAPIView
+from .views import (AsyncVoteMenuAPIView, AsyncVoteResultsForCurrentDayAPIView,
+                    DailyWinnerListAPIView, LeaderboardCacheStatsAPIView,
+                    VoteMenuAPIView, VoteResultsForCurrentDayAPIView,
+                    VoteStandingsAPIView)
 
 urlpatterns = [
     path("vote-menu/", VoteMenuAPIView.as_view(), name="vote-menu"),
@@ -9,4 +12,17 @@ urlpatterns = [
         VoteResultsForCurrentDayAPIView.as_view(),
         name="winning-menu",
     ),
+    path("results", VoteStandingsAPIView.as_view(), name="vote-standings"),
+    path("winners", DailyWinnerListAPIView.as_view(), name="daily-winners"),
+    path("async/vote-menu/", AsyncVoteMenuAPIView.as_view(), name="vote-menu-async"),
+    path(
+        "async/voting-results-for-today",
+        AsyncVoteResultsForCurrentDayAPIView.as_view(),
+        name="winning-menu-async",
+    ),
+    path(
+        "leaderboard-cache-stats/",
+        LeaderboardCacheStatsAPIView.as_view(),
+        name="leaderboard-cache-stats",
+    ),
 ]
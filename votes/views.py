@@ -1,22 +1,76 @@
-from datetime import date
+import math
+from datetime import date, timedelta
+from functools import partial
 
-from django.db.models import F, Max
-from rest_framework import generics, status, versioning
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
+from rest_framework import generics, pagination, status, versioning
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from restaurant_voting_app import metrics
+from restaurant_voting_app.versions import aday_etag, day_etag
 from restaurants.models import Menu
 from restaurants.serializers import MenuSerializer
-from user_profiles.models import Employee
+from user_profiles.authentication import aauthenticate, get_employee_id
+from user_profiles.signals import evict_user
 
-from .models import Vote
+from . import ranking
+from .ballots import (BallotError, DuplicateVoteError, NotAnEmployeeError,
+                      parse_ballot, record_ballot, record_vote)
+from .idempotency import run_idempotent
+from .leaderboard import (aget_leaderboard, get_leaderboard,
+                          leaderboard_cache_stats)
+from .models import DailyWinner
+from .serializers import DailyWinnerSerializer
+from .throttling import VoteRateThrottle
+
+MAX_STANDINGS_DAYS = 366
+
+
+def record_votes(request, votes, record, *args):
+    """
+    Record ``votes`` votes with ``record(*args)``, one of the ballot writers,
+    and count them in the metrics of the request's view. Recorded votes are
+    counted once the enclosing transaction, if any, commits.
+    """
+    view = request.resolver_match.url_name
+    try:
+        record(*args)
+    except DuplicateVoteError:
+        metrics.DUPLICATE_VOTES.labels(view).inc()
+        raise
+    except NotAnEmployeeError:
+        # The employee was removed while cached for the user's token
+        evict_user(request.user.pk)
+        raise
+    transaction.on_commit(lambda: metrics.VOTES_RECORDED.labels(view).inc(votes))
 
 
 class VoteMenuAPIView(generics.GenericAPIView):
     serializer_class = MenuSerializer
     versioning_class = versioning.AcceptHeaderVersioning
+    throttle_classes = (VoteRateThrottle,)
 
     def post(self, request, format=None):
+        # Replay the stored response when a client retries with the same key
+        idempotency_key = request.META.get("HTTP_IDEMPOTENCY_KEY")
+        if idempotency_key is not None:
+            return run_idempotent(
+                request, idempotency_key, request.data, partial(self.vote, request)
+            )
+        return self.vote(request)
+
+    def vote(self, request):
         # Check the 'Build-Version' header in the request
         build_version = request.META.get("HTTP_BUILD_VERSION")
 
@@ -32,9 +86,9 @@ class VoteMenuAPIView(generics.GenericAPIView):
         )
 
     def vote_single_menu(self, request):
-        # Get the menu ID and employee ID from the request data
+        # Get the menu ID from the request data; the voter is the user
         menu_id = request.data.get("menu_id")
-        employee_id = request.data.get("employee_id")
+        employee_id = get_employee_id(request.user)
 
         # Retrieve the menu instance with the given menu ID
         menu = Menu.objects.filter(id=menu_id).first()
@@ -45,116 +99,355 @@ class VoteMenuAPIView(generics.GenericAPIView):
                 {"error": "Invalid menu ID"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Check if the employee exists
-        if not Employee.objects.filter(id=employee_id).exists():
-            return Response(
-                {"error": "Provide a valid employee ID"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Check if the employee has already voted for the current day and menu
-        if Vote.objects.filter(
-            menu=menu, employee_id=employee_id, voted_date=date.today()
-        ).exists():
+        # Check that the user is an employee
+        if employee_id is None:
             return Response(
-                {"error": "You have already voted for this menu today"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "Only employees can vote"},
+                status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Increment the votes count for the menu
-        menu.votes = F("votes") + 1
-        menu.save()
-
-        # Create a vote record for the employee
-        Vote.objects.create(menu=menu, employee_id=employee_id)
+        # Record the vote and increment the votes count for the menu
+        try:
+            record_votes(request, 1, record_vote, menu, employee_id)
+        except NotAnEmployeeError as error:
+            return Response({"error": str(error)}, status=status.HTTP_403_FORBIDDEN)
+        except BallotError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(
             {"message": "Vote recorded successfully"}, status=status.HTTP_200_OK
         )
 
     def vote_multiple_menus(self, request):
-        # Get the vote data and employee ID from the request data
+        # Get the vote data from the request data; the voter is the user
         vote_data = request.data.get("votes")
-        employee_id = request.data.get("employee_id")
+        employee_id = get_employee_id(request.user)
 
-        # Check if the vote data is valid
-        if not isinstance(vote_data, list) or len(vote_data) != 3:
-            return Response(
-                {"error": "Invalid vote data"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        # Validate every vote in the ballot before touching the database
+        try:
+            ballot = parse_ballot(vote_data)
+        except BallotError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if the employee exists
-        if not Employee.objects.filter(id=employee_id).exists():
+        # Check that the user is an employee
+        if employee_id is None:
             return Response(
-                {"error": "Provide a valid employee ID"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "Only employees can vote"},
+                status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Process each vote in the vote data
-        for vote in vote_data:
-            menu_id = vote.get("menu_id")
-            points = vote.get("points")
+        # Record all votes of the ballot atomically
+        try:
+            record_votes(request, len(ballot), record_ballot, employee_id, ballot)
+        except NotAnEmployeeError as error:
+            return Response({"error": str(error)}, status=status.HTTP_403_FORBIDDEN)
+        except BallotError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Check if the vote data is valid
-            if (
-                not menu_id
-                or not points
-                or not isinstance(points, int)
-                or points < 1
-                or points > 3
-            ):
-                return Response(
-                    {"error": "Invalid vote data"}, status=status.HTTP_400_BAD_REQUEST
-                )
+        return Response(
+            {"message": "Votes recorded successfully"}, status=status.HTTP_200_OK
+        )
+
+
+def results_etag(request):
+    return day_etag("results", date.today())
+
+
+class VoteResultsForCurrentDayAPIView(APIView):
+    # Polling clients get a 304 without the results being serialized
+    @method_decorator(condition(etag_func=results_etag))
+    def get(self, request):
+        # Get the highly voted menus for the current day, cached between votes
+        highly_voted_menus, cache_hit = get_leaderboard(date.today())
+
+        if highly_voted_menus:
+            response = Response(highly_voted_menus, status=status.HTTP_200_OK)
+        else:
+            response = Response(
+                {
+                    "msg": "No winning menu found for the current day.",
+                    "data": None,
+                    "success": False,
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        response["X-Cache"] = "HIT" if cache_hit else "MISS"
+        return response
 
-            # Retrieve the menu instance with the given menu ID
-            menu = Menu.objects.filter(id=menu_id).first()
 
-            # Check if the menu exists
-            if not menu:
+class VoteStandingsAPIView(APIView):
+    def get(self, request):
+        # Parse the range of days, the week up to today by default
+        try:
+            date_to = date.fromisoformat(request.query_params.get("to", ""))
+        except ValueError:
+            if "to" in request.query_params:
                 return Response(
-                    {"error": "Invalid menu ID"}, status=status.HTTP_400_BAD_REQUEST
+                    {"error": "Invalid 'to' date, use YYYY-MM-DD"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-
-            # Check if the employee has already voted for the current day and menu
-            if Vote.objects.filter(
-                menu=menu, employee_id=employee_id, voted_date=date.today()
-            ).exists():
+            date_to = date.today()
+        try:
+            date_from = date.fromisoformat(request.query_params.get("from", ""))
+        except ValueError:
+            if "from" in request.query_params:
                 return Response(
-                    {"error": "You have already voted for this menu today"},
+                    {"error": "Invalid 'from' date, use YYYY-MM-DD"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            date_from = date_to - timedelta(days=6)
 
-            # Increment the votes count for the menu
-            menu.votes = F("votes") + points
-            menu.save()
+        if not date_from <= date_to <= date_from + timedelta(days=MAX_STANDINGS_DAYS):
+            return Response(
+                {
+                    "error": "'from' must not be after 'to' and the range must "
+                    f"not exceed {MAX_STANDINGS_DAYS} days"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            # Create a vote record for the employee
-            Vote.objects.create(menu=menu, employee_id=employee_id)
+        # Check the scoring method
+        method = request.query_params.get("method", "raw")
+        if method not in ranking.METHODS:
+            return Response(
+                {"error": f"Invalid method, use one of {', '.join(ranking.METHODS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         return Response(
-            {"message": "Votes recorded successfully"}, status=status.HTTP_200_OK
+            {
+                "from": date_from,
+                "to": date_to,
+                "method": method,
+                "results": ranking.get_standings(date_from, date_to, method),
+            },
+            status=status.HTTP_200_OK,
         )
 
 
-class VoteResultsForCurrentDayAPIView(APIView):
+class DailyWinnerPagination(pagination.PageNumberPagination):
+    page_size = 31
+    page_size_query_param = "page_size"
+    max_page_size = 366
+
+
+class DailyWinnerListAPIView(generics.ListAPIView):
+    serializer_class = DailyWinnerSerializer
+    pagination_class = DailyWinnerPagination
+
+    def get_queryset(self):
+        # Retrieve the recorded winners in the requested range of days
+        winners = DailyWinner.objects.order_by("date", "menu")
+        for param, lookup in (("from", "date__gte"), ("to", "date__lte")):
+            if param not in self.request.query_params:
+                continue
+            try:
+                day = date.fromisoformat(self.request.query_params[param])
+            except ValueError:
+                raise ValidationError(
+                    {"error": f"Invalid '{param}' date, use YYYY-MM-DD"}
+                )
+            winners = winners.filter(**{lookup: day})
+        return winners
+
+
+class LeaderboardCacheStatsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
     def get(self, request):
-        # Get the menu with the maximum votes for the current day
-        max_votes = Menu.objects.filter(created_at__date=date.today()).aggregate(
-            Max("votes")
-        )["votes__max"]
-
-        # Retrieve the highly voted menus for the current day
-        highly_voted_menus = Menu.objects.filter(
-            created_at__date=date.today(), votes=max_votes
+        # Report the hit rate of the cached leaderboard
+        return Response(leaderboard_cache_stats(), status=status.HTTP_200_OK)
+
+
+class AsyncAPIView(View):
+    """
+    Base class for native async JSON views, authenticated with the API's
+    DEFAULT_AUTHENTICATION_CLASSES and parsing request bodies with its
+    DEFAULT_PARSER_CLASSES, like the sync API views.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authenticated API views are exempt from CSRF, like APIView
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await aauthenticate(request)
+        if request.user is None:
+            response = JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+            response["WWW-Authenticate"] = self.get_authenticate_header(request)
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_authenticate_header(self, request):
+        # The challenge of the first authenticator, as APIView sends it
+        authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+        return authenticator.authenticate_header(request)
+
+    def parse(self, request):
+        """
+        Return the parsed body of ``request``, JSON, form or multipart.
+        Raises ParseError for malformed bodies.
+        """
+        return Request(
+            request,
+            parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        ).data
+
+
+class AsyncVoteMenuAPIView(AsyncAPIView):
+    async def post(self, request):
+        # Shed throttled clients before any database work
+        throttle = VoteRateThrottle()
+        if not await throttle.aallow_request(request, self):
+            response = JsonResponse(
+                {"detail": "Request was throttled."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+            )
+            response["Retry-After"] = str(math.ceil(throttle.wait()))
+            return response
+
+        try:
+            data = await sync_to_async(self.parse)(request)
+        except ParseError as error:
+            return JsonResponse(
+                {"detail": str(error.detail)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(data, dict):
+            return JsonResponse(
+                {"error": "Invalid vote data"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Replay the stored response when a client retries with the same key.
+        # The vote then runs in a thread, inside the transaction storing its
+        # response; its own thread hops come back to that thread.
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is not None:
+            return await sync_to_async(run_idempotent)(
+                request,
+                idempotency_key,
+                data,
+                async_to_sync(partial(self.vote, data)),
+                response_class=JsonResponse,
+            )
+        return await self.vote(data)
+
+    async def vote(self, data):
+        # Check the 'Build-Version' header in the request
+        build_version = self.request.META.get("HTTP_BUILD_VERSION")
+
+        # Process the request based on the build version
+        if build_version == "old":
+            return await self.vote_single_menu(data)
+        elif build_version == "new":
+            return await self.vote_multiple_menus(data)
+
+        # Return an error response for invalid API version
+        return JsonResponse(
+            {"error": "Invalid API version"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    async def vote_single_menu(self, data):
+        # Get the menu ID from the request data; the voter is the user
+        menu_id = data.get("menu_id")
+        employee_id = await sync_to_async(get_employee_id)(self.request.user)
+
+        # Retrieve the menu instance with the given menu ID
+        try:
+            menu = await Menu.objects.filter(id=menu_id).afirst()
+        except (TypeError, ValueError):
+            menu = None
+
+        # Check if the menu exists
+        if not menu:
+            return JsonResponse(
+                {"error": "Invalid menu ID"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Check that the user is an employee
+        if employee_id is None:
+            return JsonResponse(
+                {"error": "Only employees can vote"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        # The write needs a transaction, which the async ORM cannot open, so it
+        # runs on the single thread shared by all thread sensitive calls
+        try:
+            await sync_to_async(record_votes)(
+                self.request, 1, record_vote, menu, employee_id
+            )
+        except NotAnEmployeeError as error:
+            return JsonResponse({"error": str(error)}, status=status.HTTP_403_FORBIDDEN)
+        except BallotError as error:
+            return JsonResponse(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return JsonResponse(
+            {"message": "Vote recorded successfully"}, status=status.HTTP_200_OK
+        )
+
+    async def vote_multiple_menus(self, data):
+        # Get the vote data from the request data; the voter is the user
+        vote_data = data.get("votes")
+        employee_id = await sync_to_async(get_employee_id)(self.request.user)
+
+        # Validate every vote in the ballot before touching the database
+        try:
+            ballot = parse_ballot(vote_data)
+        except BallotError as error:
+            return JsonResponse(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Check that the user is an employee
+        if employee_id is None:
+            return JsonResponse(
+                {"error": "Only employees can vote"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        # Record all votes of the ballot atomically
+        try:
+            await sync_to_async(record_votes)(
+                self.request, len(ballot), record_ballot, employee_id, ballot
+            )
+        except NotAnEmployeeError as error:
+            return JsonResponse({"error": str(error)}, status=status.HTTP_403_FORBIDDEN)
+        except BallotError as error:
+            return JsonResponse(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return JsonResponse(
+            {"message": "Votes recorded successfully"}, status=status.HTTP_200_OK
         )
 
-        if highly_voted_menus.exists():
-            # Serialize the highly voted menus
-            serializer = MenuSerializer(highly_voted_menus, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+
+class AsyncVoteResultsForCurrentDayAPIView(AsyncAPIView):
+    async def get(self, request):
+        # Polling clients get a 304 without the results being serialized
+        today = date.today()
+        etag = await aday_etag("results", today)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        # Get the highly voted menus for the current day, cached between votes
+        highly_voted_menus, cache_hit = await aget_leaderboard(today)
+
+        if highly_voted_menus:
+            response = JsonResponse(
+                highly_voted_menus, status=status.HTTP_200_OK, safe=False
+            )
         else:
-            return Response(
+            response = JsonResponse(
                 {
                     "msg": "No winning menu found for the current day.",
                     "data": None,
@@ -162,3 +455,7 @@ class VoteResultsForCurrentDayAPIView(APIView):
                 },
                 status=status.HTTP_404_NOT_FOUND,
             )
+        response["X-Cache"] = "HIT" if cache_hit else "MISS"
+        if etag is not None:
+            response["ETag"] = etag
+        return response